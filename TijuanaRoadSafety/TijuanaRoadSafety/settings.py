@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -57,8 +58,63 @@ CSRF_FAILURE_VIEW = 'django.views.csrf.csrf_failure'
 # API Keys
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY")
+# Roboflow client (see mapapp/roboflow.py): seconds to wait for a connection
+# and for a detection before giving up, retries of failed connections and
+# 429/5xx answers with a random backoff starting at ROBOFLOW_BACKOFF_SECONDS,
+# and a circuit breaker that fails fast for ROBOFLOW_BREAKER_RESET_SECONDS
+# after ROBOFLOW_BREAKER_FAILURES consecutive failures
+ROBOFLOW_CONNECT_TIMEOUT_SECONDS = float(os.getenv('ROBOFLOW_CONNECT_TIMEOUT_SECONDS', '3'))
+ROBOFLOW_TIMEOUT_SECONDS = float(os.getenv('ROBOFLOW_TIMEOUT_SECONDS', '10'))
+ROBOFLOW_MAX_RETRIES = int(os.getenv('ROBOFLOW_MAX_RETRIES', '2'))
+ROBOFLOW_BACKOFF_SECONDS = float(os.getenv('ROBOFLOW_BACKOFF_SECONDS', '0.5'))
+ROBOFLOW_BREAKER_FAILURES = int(os.getenv('ROBOFLOW_BREAKER_FAILURES', '5'))
+ROBOFLOW_BREAKER_RESET_SECONDS = float(os.getenv('ROBOFLOW_BREAKER_RESET_SECONDS', '30'))
+# Roboflow requests in flight at once when detecting a batch of images, and
+# keep-alive connections pooled per worker
+ROBOFLOW_MAX_CONCURRENCY = int(os.getenv('ROBOFLOW_MAX_CONCURRENCY', '4'))
+
+# Pothole detector backend (see mapapp/detectors.py): 'roboflow', 'onnx' for a
+# local YOLOv8 model run with onnxruntime, 'stub' for tests and benchmarks, or
+# 'none' to accept submissions without detection
+DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'roboflow' if ROBOFLOW_API_KEY else 'none')
+DETECTOR_ONNX_MODEL = os.getenv('DETECTOR_ONNX_MODEL', str(BASE_DIR / 'models' / 'pothole.onnx'))
+DETECTOR_ONNX_CLASSES = os.getenv('DETECTOR_ONNX_CLASSES', 'Pothole').split(',')
+# A photo is accepted when the detector's most confident prediction is a
+# pothole with at least this confidence
+DETECTION_MIN_CONFIDENCE = float(os.getenv('DETECTION_MIN_CONFIDENCE', '0.8'))
+# Detection results are cached per image content in the database, shared by
+# all workers; entries expire after the TTL and the least recently used ones
+# are evicted beyond the size limit
+DETECTION_CACHE_TTL_SECONDS = int(os.getenv('DETECTION_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+DETECTION_CACHE_MAX_ENTRIES = int(os.getenv('DETECTION_CACHE_MAX_ENTRIES', '10000'))
+# Fraction of stored results that also prune the table; the rest leave it to
+# `python manage.py detection_cache --prune`, which can run periodically
+DETECTION_CACHE_PRUNE_RATE = float(os.getenv('DETECTION_CACHE_PRUNE_RATE', '0.01'))
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+# Photos sent over WhatsApp are kept in the shared cache for this long while
+# the rest of the report is collected (see mapapp/whatsapp_media.py)
+WHATSAPP_MEDIA_TTL_SECONDS = int(os.getenv('WHATSAPP_MEDIA_TTL_SECONDS', '1800'))
+# Connect and read timeouts of media downloads from Twilio, so a stalled one
+# cannot hold a sender's queue and its worker thread forever
+WHATSAPP_MEDIA_CONNECT_TIMEOUT_SECONDS = float(os.getenv('WHATSAPP_MEDIA_CONNECT_TIMEOUT_SECONDS', '3'))
+WHATSAPP_MEDIA_TIMEOUT_SECONDS = float(os.getenv('WHATSAPP_MEDIA_TIMEOUT_SECONDS', '15'))
+# Inbound WhatsApp messages are queued and processed by this many threads per
+# worker process, the replies sent through the Twilio API (see mapapp/whatsapp.py);
+# with 0 they are processed within the webhook request. Beyond
+# WHATSAPP_MAX_PENDING queued messages the webhook answers 503.
+WHATSAPP_WORKERS = int(os.getenv('WHATSAPP_WORKERS', '4'))
+WHATSAPP_MAX_PENDING = int(os.getenv('WHATSAPP_MAX_PENDING', '500'))
+TWILIO_API_URL = os.getenv('TWILIO_API_URL', 'https://api.twilio.com')
+TWILIO_API_TIMEOUT_SECONDS = float(os.getenv('TWILIO_API_TIMEOUT_SECONDS', '10'))
+# Public URL of the webhook as configured in Twilio, used to check request
+# signatures when a proxy changes the URL the app sees
+TWILIO_WEBHOOK_URL = os.getenv('TWILIO_WEBHOOK_URL')
+# Where WhatsApp conversation state is kept (see mapapp/conversations.py):
+# 'cache' (the shared cache, best with Redis) or 'db'. A conversation is
+# forgotten this long after its last message.
+WHATSAPP_STATE_BACKEND = os.getenv('WHATSAPP_STATE_BACKEND', 'cache' if os.getenv('REDIS_URL') else 'db')
+WHATSAPP_CONVERSATION_TTL_SECONDS = int(os.getenv('WHATSAPP_CONVERSATION_TTL_SECONDS', str(24 * 3600)))
 
 # Cloudinary configuration for reliable image storage
 CLOUDINARY_STORAGE = {
@@ -134,10 +190,77 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Take the write lock when a transaction starts so concurrent
+            # submissions for the same spot are serialized (see mapapp/locking.py)
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
         }
     }
     print("⚠️  Using local SQLite Database - Deploy to Railway for PostgreSQL")
 
+# Cache for pages and payloads derived from every report (see mapapp/caching.py).
+# Entries are invalidated by bumping a version key, so every worker must share
+# the backend: Redis when REDIS_URL is set, otherwise files on local disk.
+# CACHE_BACKEND=locmem keeps the cache per process (single worker only).
+REDIS_URL = os.getenv('REDIS_URL')
+CACHE_TIMEOUT_SECONDS = int(os.getenv('CACHE_TIMEOUT_SECONDS', '86400'))
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': CACHE_TIMEOUT_SECONDS,
+        }
+    }
+elif os.getenv('CACHE_BACKEND') == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'TIMEOUT': CACHE_TIMEOUT_SECONDS,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'tijuana-road-safety-cache')),
+            'TIMEOUT': CACHE_TIMEOUT_SECONDS,
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Optional PostGIS spatial index for nearby-pothole queries (PostgreSQL only).
+# Requires the postgis extension; run `python manage.py setup_postgis` after
+# enabling it on a database that was migrated without it.
+USE_POSTGIS = os.getenv('USE_POSTGIS', 'False').lower() == 'true'
+
+# New submissions this close to an open pothole are merged into it on submit
+POTHOLE_MERGE_RADIUS_METERS = float(os.getenv('POTHOLE_MERGE_RADIUS_METERS', '50'))
+
+# Save web submissions as pending and run pothole detection in the background
+# instead of during the request (see mapapp/validation.py). With 0 workers the
+# detection runs right after the request's transaction commits, in the same thread.
+DEFERRED_VALIDATION = os.getenv('DEFERRED_VALIDATION', 'True').lower() == 'true'
+DEFERRED_VALIDATION_WORKERS = int(os.getenv('DEFERRED_VALIDATION_WORKERS', '2'))
+
+# Minimum seconds between incremental refreshes of the per-worker report snapshot
+REPORT_SNAPSHOT_REFRESH_SECONDS = float(os.getenv('REPORT_SNAPSHOT_REFRESH_SECONDS', '2'))
+
+# Public map clustering: reports within this many screen pixels are drawn as one
+# cluster, up to MAP_CLUSTER_MAX_ZOOM; closer in, individual markers are shown
+MAP_CLUSTER_RADIUS_PX = int(os.getenv('MAP_CLUSTER_RADIUS_PX', '60'))
+MAP_CLUSTER_MAX_ZOOM = int(os.getenv('MAP_CLUSTER_MAX_ZOOM', '15'))
+
+# Heatmap density grid: area covered as south,west,north,east and the number of
+# cells per side of the finest grid (a multiple of 16; coarser grids halve it)
+DENSITY_GRID_BOUNDS = tuple(float(value) for value in os.getenv(
+    'DENSITY_GRID_BOUNDS', '32.40,-117.13,32.60,-116.85'
+).split(','))
+DENSITY_GRID_RESOLUTION = int(os.getenv('DENSITY_GRID_RESOLUTION', '512'))
+
+# How long browsers and CDNs may reuse a map tile before revalidating its ETag
+MAP_TILE_MAX_AGE_SECONDS = int(os.getenv('MAP_TILE_MAX_AGE_SECONDS', '60'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -187,6 +310,18 @@ else:
     # Local development only
     MEDIA_ROOT = BASE_DIR / 'media'
 
+# Encoding of the resized copies of report photos: JPEG or WEBP
+IMAGE_DERIVATIVE_FORMAT = os.getenv('IMAGE_DERIVATIVE_FORMAT', 'JPEG').upper()
+
+# Photos whose perceptual hashes differ in at most this many of 64 bits are
+# treated as the same photo uploaded again
+PHOTO_MATCH_MAX_DISTANCE = int(os.getenv('PHOTO_MATCH_MAX_DISTANCE', '6'))
+
+# Uploaded photos larger than this many bytes or pixels are refused while
+# they stream in (see mapapp/uploads.py)
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(15 * 1024 * 1024)))
+MAX_UPLOAD_PIXELS = int(os.getenv('MAX_UPLOAD_PIXELS', '40000000'))
+
 # WhiteNoise configuration for static files
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
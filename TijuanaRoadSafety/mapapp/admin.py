@@ -37,7 +37,8 @@ class PotholeReportAdmin(admin.ModelAdmin):
         'timestamp', 
         'last_updated',
         'submission_count',
-        'latest_submission_date'
+        'latest_submission_date',
+        'duplicate_of'
     ]
     
     fieldsets = (
@@ -51,7 +52,7 @@ class PotholeReportAdmin(admin.ModelAdmin):
             'fields': ('phone_number', 'reporter_name', 'additional_notes')
         }),
         ('Tracking', {
-            'fields': ('submission_count', 'submission_source', 'timestamp', 'last_updated', 'latest_submission_date'),
+            'fields': ('submission_count', 'submission_source', 'timestamp', 'last_updated', 'latest_submission_date', 'duplicate_of'),
             'classes': ('collapse',)
         }),
         ('AI Analysis', {
@@ -64,7 +65,7 @@ class PotholeReportAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 4px;" />',
-                obj.image.url
+                obj.small_image_url
             )
         return "No Image"
     image_thumbnail.short_description = "Image"
@@ -73,7 +74,7 @@ class PotholeReportAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-width: 300px; max-height: 300px; object-fit: contain;" />',
-                obj.image.url
+                obj.medium_image_url
             )
         return "No Image"
     image_preview.short_description = "Image Preview"
@@ -82,11 +83,11 @@ class PotholeReportAdmin(admin.ModelAdmin):
     actions = ['mark_as_resolved', 'mark_as_in_progress', 'export_as_csv']
     
     def mark_as_resolved(self, request, queryset):
-        queryset.update(status='resolved')
-        self.message_user(request, f"{queryset.count()} reports marked as resolved.")
+        count = PotholeReport.bulk_set_status(queryset, 'resolved')
+        self.message_user(request, f"{count} reports marked as resolved.")
     mark_as_resolved.short_description = "Mark selected reports as resolved"
     
     def mark_as_in_progress(self, request, queryset):
-        queryset.update(status='in_progress')
-        self.message_user(request, f"{queryset.count()} reports marked as in progress.")
+        count = PotholeReport.bulk_set_status(queryset, 'in_progress')
+        self.message_user(request, f"{count} reports marked as in progress.")
     mark_as_in_progress.short_description = "Mark selected reports as in progress"
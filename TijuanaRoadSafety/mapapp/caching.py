@@ -0,0 +1,64 @@
+"""
+Versioned cache entries for pages and payloads derived from all reports.
+
+Every key embeds the current reports version, a counter kept in the shared
+cache and bumped after any transaction that creates, changes or deletes a
+report commits (see signals.py and PotholeReport.increment_submission_count).
+Readers never delete anything: after a bump they simply look up new keys, and
+entries under old versions age out through the cache timeout.
+
+Culling caches (file based, LocMem) may evict the counter itself. It is then
+seeded again from the clock in nanoseconds rather than from 1, so it never
+goes back to a version whose entries are still cached.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+REPORTS_VERSION_KEY = 'mapapp:reports-version'
+
+
+def reports_version():
+    version = cache.get(REPORTS_VERSION_KEY)
+    if version is None:
+        seed = time.time_ns()
+        cache.add(REPORTS_VERSION_KEY, seed, timeout=None)
+        version = cache.get(REPORTS_VERSION_KEY, seed)
+    return version
+
+
+def bump_reports_version():
+    # incr is atomic on Redis; on the file backend two racing bumps may count
+    # once, which still moves readers off the old version
+    try:
+        cache.incr(REPORTS_VERSION_KEY)
+    except ValueError:
+        cache.add(REPORTS_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_reports():
+    """Bump the reports version once the current transaction commits"""
+    transaction.on_commit(bump_reports_version)
+
+
+def cached(name, compute, *parts):
+    """
+    Return the value cached for name and parts under the current reports
+    version, calling compute() to fill it on a miss
+    """
+    key = ':'.join(['mapapp', name, str(reports_version()), *map(str, parts)])
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
+
+
+def increment_counter(key, amount=1):
+    """Add amount to a counter in the shared cache, creating it if needed"""
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
@@ -0,0 +1,57 @@
+"""
+One-pass folding of duplicate reports that predate merge-on-submit.
+
+PotholeReport.submit() already merges a new report into the nearest verified
+pothole within POTHOLE_MERGE_RADIUS_METERS. MergeIndex replays that rule over
+the existing reports, oldest first, for the `cluster_reports` command: a
+report with a kept pothole within the radius becomes its duplicate, any other
+report is kept as a pothole itself. The kept potholes live in a geohash grid,
+so each report only looks at the potholes of its own cell and its eight
+neighbours.
+"""
+from collections import defaultdict
+
+from . import geo
+
+
+class MergeIndex:
+    """
+    Kept potholes by geohash cell. Each pothole is an integer index into
+    parallel lists.
+    """
+
+    def __init__(self, radius, max_abs_latitude):
+        self.radius = radius
+        self.precision = geo.precision_for_radius(max_abs_latitude, radius)
+        self.report_id = []
+        self.latitude = []
+        self.longitude = []
+        self.grid = defaultdict(list)
+
+    def add(self, report_id, latitude, longitude):
+        """
+        Add one report; returns the id of the kept pothole it duplicates, or
+        None if it is kept as a new pothole
+        """
+        candidates = []
+        for cell in geo.geohash_neighbours(latitude, longitude, self.precision):
+            candidates.extend(self.grid.get(cell, ()))
+        distances = geo.distances_from_point(
+            latitude, longitude,
+            [self.latitude[index] for index in candidates],
+            [self.longitude[index] for index in candidates],
+        )
+        matches = [(distance, index) for index, distance in zip(candidates, distances) if distance <= self.radius]
+        if matches:
+            # The nearest pothole, as submit() would pick
+            return self.report_id[min(matches)[1]]
+
+        index = len(self.report_id)
+        self.report_id.append(report_id)
+        self.latitude.append(latitude)
+        self.longitude.append(longitude)
+        self.grid[geo.geohash_encode(latitude, longitude, self.precision)].append(index)
+        return None
+
+    def __len__(self):
+        return len(self.report_id)
@@ -0,0 +1,179 @@
+"""
+State of WhatsApp conversations, keyed by the sender's phone number.
+
+Every inbound message moves the sender's conversation one step (see
+whatsapp.handle_message). The state is a small JSON-able dict kept per
+normalized phone number, so it does not depend on Twilio sending a session
+cookie back, and it expires WHATSAPP_CONVERSATION_TTL_SECONDS after the last
+message: a sender who comes back later starts over.
+
+Two stores, chosen by WHATSAPP_STATE_BACKEND:
+
+- 'db': one WhatsAppConversation row per sender. Expired rows are ignored
+  and deleted by `python manage.py cleanup_conversations`;
+- 'cache': one entry per sender in the shared cache, which expires entries
+  itself.
+
+Each state carries a version that grows with every change. transition()
+loads the state, applies a step and writes it back only if the version is
+still the one it loaded (compare-and-set), re-running the step on the
+latest state otherwise. Steps must therefore only change the state: work
+with side effects, such as saving a report, is returned by the step and
+run by the caller once the state is stored (see whatsapp.process_message).
+Messages of one sender are already processed in order within a worker
+process, so conflicts only happen when two processes handle the same
+sender at once.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import WhatsAppConversation
+
+CONVERSATION_PREFIX = 'mapapp:whatsapp-conversation:'
+# Seconds a cache store lock is held at most, should its owner die
+LOCK_TIMEOUT_SECONDS = 5
+MAX_ATTEMPTS = 5
+
+
+class ConversationConflict(Exception):
+    pass
+
+
+def normalize_number(sender):
+    """The phone number of a Twilio From value: 'whatsapp:+52 664 123 4567' -> '+526641234567'"""
+    digits = ''.join(character for character in sender.split(':', 1)[-1] if character.isdigit())
+    return f'+{digits}' if digits else ''
+
+
+class ConversationStore:
+    def __init__(self, ttl_seconds=None):
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def ttl(self):
+        return self.ttl_seconds or settings.WHATSAPP_CONVERSATION_TTL_SECONDS
+
+    def load(self, number):
+        """(state, version) of a conversation; an absent or expired one is ({}, its last version or 0)"""
+        raise NotImplementedError
+
+    def compare_and_set(self, number, state, version):
+        """Store state if the conversation is still at version; returns whether it was stored"""
+        raise NotImplementedError
+
+    def delete(self, number):
+        raise NotImplementedError
+
+    def cleanup(self):
+        """Delete expired conversations; returns how many were deleted"""
+        return 0
+
+    def transition(self, number, step):
+        """
+        Apply step(state), which changes state in place, atomically: if another
+        update got in first, step runs again on the newer state, so it must
+        have no other effects. Returns what step returned on the run that
+        was stored.
+        """
+        for _ in range(MAX_ATTEMPTS):
+            state, version = self.load(number)
+            result = step(state)
+            if self.compare_and_set(number, state, version):
+                return result
+        raise ConversationConflict(f'Conversation with {number} kept changing')
+
+
+class DatabaseConversationStore(ConversationStore):
+    def load(self, number):
+        row = WhatsAppConversation.objects.filter(phone_number=number).values('state', 'version', 'expires_at').first()
+        if row is None:
+            return {}, 0
+        if row['expires_at'] <= timezone.now():
+            return {}, row['version']
+        return row['state'], row['version']
+
+    def compare_and_set(self, number, state, version):
+        expires_at = timezone.now() + timedelta(seconds=self.ttl)
+        if version == 0:
+            try:
+                with transaction.atomic():
+                    WhatsAppConversation.objects.create(
+                        phone_number=number, state=state, version=1, expires_at=expires_at
+                    )
+                return True
+            except IntegrityError:
+                return False
+        updated = WhatsAppConversation.objects.filter(phone_number=number, version=version).update(
+            state=state, version=version + 1, expires_at=expires_at
+        )
+        return updated == 1
+
+    def delete(self, number):
+        WhatsAppConversation.objects.filter(phone_number=number).delete()
+
+    def cleanup(self):
+        deleted, _ = WhatsAppConversation.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class CacheConversationStore(ConversationStore):
+    """
+    Entries are (version, state) pairs. New conversations are created with
+    cache.add; updates take a short lock, also through cache.add, which is
+    atomic on Redis
+    """
+
+    def key(self, number):
+        return CONVERSATION_PREFIX + number
+
+    def load(self, number):
+        entry = cache.get(self.key(number))
+        if entry is None:
+            return {}, 0
+        version, state = entry
+        return state, version
+
+    def compare_and_set(self, number, state, version):
+        key = self.key(number)
+        if version == 0:
+            return cache.add(key, (1, state), timeout=self.ttl)
+        lock = f'{key}:lock'
+        if not cache.add(lock, True, timeout=LOCK_TIMEOUT_SECONDS):
+            return False
+        try:
+            entry = cache.get(key)
+            if entry is None or entry[0] != version:
+                return False
+            cache.set(key, (version + 1, state), timeout=self.ttl)
+            return True
+        finally:
+            cache.delete(lock)
+
+    def delete(self, number):
+        cache.delete(self.key(number))
+
+
+BACKENDS = {
+    'db': DatabaseConversationStore,
+    'cache': CacheConversationStore,
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_conversation_store(backend=None):
+    """The conversation store for a backend name (WHATSAPP_STATE_BACKEND by default), created once per process"""
+    backend = backend or settings.WHATSAPP_STATE_BACKEND
+    with _stores_lock:
+        if backend not in _stores:
+            if backend not in BACKENDS:
+                raise ImproperlyConfigured(f'Unknown WHATSAPP_STATE_BACKEND: {backend}')
+            _stores[backend] = BACKENDS[backend]()
+    return _stores[backend]
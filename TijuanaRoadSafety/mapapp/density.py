@@ -0,0 +1,124 @@
+"""
+Pothole density grids for the heatmap layer.
+
+Open reports inside DENSITY_GRID_BOUNDS are binned into a grid of
+DENSITY_GRID_RESOLUTION cells per side with np.histogram2d, each report
+weighted by severity times submission_count. Coarser grids are built by
+summing 2x2 blocks of the one below, so every resolution adds up to the same
+total. Row 0 is the southernmost row and column 0 the westernmost column.
+
+Like the cluster pyramid, the grids live next to the per-worker report
+snapshot and follow its change notifications, so a new or confirmed report
+adjusts one cell per resolution instead of triggering a rebuild.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .models import PotholeReport
+from .snapshot import STATUS_CODES, get_snapshot
+
+# Coarser grids kept below the finest one, each half the resolution of the previous
+COARSER_LEVELS = 4
+
+
+def report_weight(severity, submission_count):
+    return severity * submission_count
+
+
+class DensityGrid:
+    def __init__(self, snapshot, bounds, resolution, levels=COARSER_LEVELS):
+        self.snapshot = snapshot
+        self.bounds = tuple(bounds)
+        self.resolutions = [resolution >> level for level in range(levels + 1) if resolution >> level > 0]
+        if any(r << level != resolution for level, r in enumerate(self.resolutions)):
+            raise ValueError('Density grid resolution must be divisible by 2**levels')
+        south, west, north, east = self.bounds
+        self.lat_edges = np.linspace(south, north, resolution + 1)
+        self.lon_edges = np.linspace(west, east, resolution + 1)
+        self.grids = None
+        self.open_codes = {STATUS_CODES[status] for status in PotholeReport.OPEN_STATUSES}
+        snapshot.subscribe(self.on_change)
+
+    def _build(self):
+        snapshot = self.snapshot
+        columns = snapshot.rows(snapshot.mask(statuses=PotholeReport.OPEN_STATUSES, bbox=self.bounds))
+        weights = report_weight(columns['severity'].astype(np.int64), columns['submission_count'].astype(np.int64))
+        histogram, _, _ = np.histogram2d(
+            columns['latitude'], columns['longitude'],
+            bins=[self.lat_edges, self.lon_edges], weights=weights,
+        )
+
+        grids = [np.rint(histogram).astype(np.int64)]
+        for resolution in self.resolutions[1:]:
+            grids.append(grids[-1].reshape(resolution, 2, resolution, 2).sum(axis=(1, 3)))
+        self.grids = grids
+
+    def _cell(self, latitude, longitude):
+        """(row, column) of the finest cell holding a point, or None outside the bounds"""
+        south, west, north, east = self.bounds
+        if not (south <= latitude <= north and west <= longitude <= east):
+            return None
+        # Same binning as np.histogram2d, which also puts points on the north
+        # and east edges in the last cell
+        finest = self.resolutions[0]
+        row = min(int(np.searchsorted(self.lat_edges, latitude, side='right')) - 1, finest - 1)
+        column = min(int(np.searchsorted(self.lon_edges, longitude, side='right')) - 1, finest - 1)
+        return row, column
+
+    def _apply(self, report, sign):
+        _, latitude, longitude, severity, submission_count, status = report
+        if status not in self.open_codes:
+            return
+        cell = self._cell(latitude, longitude)
+        if cell is None:
+            return
+        weight = sign * report_weight(severity, submission_count)
+        for level, grid in enumerate(self.grids):
+            grid[cell[0] >> level, cell[1] >> level] += weight
+
+    def on_change(self, old, new):
+        """Snapshot listener: move one report's weight between cells"""
+        if self.grids is None:
+            return
+        if old is not None:
+            self._apply(old, -1)
+        if new is not None:
+            self._apply(new, 1)
+
+    def grid(self, resolution):
+        """A copy of the grid with the given number of cells per side"""
+        with self.snapshot.lock:
+            if self.grids is None:
+                self._build()
+            return self.grids[self.resolutions.index(resolution)].copy()
+
+    def sparse(self, resolution):
+        """
+        The non-empty cells of a grid as flat row-major indices and their
+        weights, plus the largest weight, for sending to the map
+        """
+        grid = self.grid(resolution)
+        cells = np.flatnonzero(grid)
+        weights = grid.ravel()[cells]
+        return cells, weights, int(weights.max(initial=0))
+
+
+_density_grid = None
+_density_grid_lock = threading.Lock()
+
+
+def get_density_grid():
+    """The density grids for this worker process, kept in step with its snapshot"""
+    global _density_grid
+    snapshot = get_snapshot()
+    with _density_grid_lock:
+        if _density_grid is None:
+            with snapshot.lock:
+                _density_grid = DensityGrid(
+                    snapshot,
+                    bounds=settings.DENSITY_GRID_BOUNDS,
+                    resolution=settings.DENSITY_GRID_RESOLUTION,
+                )
+    return _density_grid
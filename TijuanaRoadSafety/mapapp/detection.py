@@ -0,0 +1,32 @@
+"""
+Verdicts on report photos from pothole detector results (see detectors.py
+for the backends that produce them)
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Whether submissions are checked by a detector at all
+AI_AVAILABLE = settings.DETECTOR_BACKEND != 'none'
+
+# The first prediction must be a pothole with at least
+# DETECTION_MIN_CONFIDENCE, read on every call so setting changes apply
+POTHOLE_CLASS = "Pothole"
+
+
+def evaluate_detection(result, min_confidence=None):
+    """
+    Return (accepted, confidence) for a detection result: the image is
+    accepted when its first prediction is a pothole with at least
+    min_confidence (DETECTION_MIN_CONFIDENCE by default)
+    """
+    if min_confidence is None:
+        min_confidence = settings.DETECTION_MIN_CONFIDENCE
+    if not result.get('predictions'):
+        return False, None
+    prediction = result['predictions'][0]
+    logger.info(f"AI prediction: class={prediction.get('class')}, confidence={prediction.get('confidence')}")
+    accepted = prediction.get('confidence', 0) >= min_confidence and prediction.get('class') == POTHOLE_CLASS
+    return accepted, prediction.get('confidence')
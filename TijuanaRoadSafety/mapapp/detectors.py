@@ -0,0 +1,212 @@
+"""
+Pothole detector backends.
+
+DETECTOR_BACKEND picks the backend every detection goes through (see
+get_detector):
+
+- 'roboflow': the hosted Roboflow model over HTTP, needs ROBOFLOW_API_KEY
+- 'onnx': a YOLOv8 model exported to ONNX (DETECTOR_ONNX_MODEL), run on the
+  CPU with onnxruntime, an optional dependency
+- 'stub': a deterministic stand-in for tests and benchmarks
+- 'none': no detection; reports are accepted without a check
+
+A dotted path to a Detector subclass also works. Every backend takes a batch
+of encoded JPEGs (DecodedImage.detection_jpeg) and returns one result per
+image in Roboflow's format: {'predictions': [{'x', 'y', 'width', 'height',
+'confidence', 'class'}, ...]}, most confident first, plus an 'error' entry
+when the image could not be checked.
+"""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from .detection import POTHOLE_CLASS
+from .roboflow import get_roboflow_client
+
+
+class Detector:
+    # Identifies the model; part of the detection cache key
+    model_version = None
+
+    def detect_batch(self, images):
+        """One result per encoded image, in order"""
+        raise NotImplementedError
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+
+class RoboflowDetector(Detector):
+    """
+    The hosted model, through the pooled and circuit-broken client in
+    roboflow.py. The API takes one image per request, so a batch is sent as
+    up to ROBOFLOW_MAX_CONCURRENCY requests at a time.
+    """
+    model_version = "pothole-detection-bqu6s/9"
+    model_url = f"https://detect.roboflow.com/{model_version}"
+
+    def __init__(self, client=None, max_concurrency=None):
+        self.client = client or get_roboflow_client(self.model_url)
+        self.max_concurrency = max_concurrency or settings.ROBOFLOW_MAX_CONCURRENCY
+
+    def detect_batch(self, images):
+        if len(images) <= 1:
+            return [self.client.infer(image) for image in images]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(images))) as executor:
+            return list(executor.map(self.client.infer, images))
+
+
+class StubDetector(Detector):
+    """
+    Deterministic stand-in: every image gets one pothole prediction covering
+    its middle, with a confidence between 0.5 and 1 derived from its bytes, so
+    the same image always gets the same verdict and about 40% pass the default
+    0.8 threshold
+    """
+    model_version = 'stub/1'
+
+    def detect_batch(self, images):
+        results = []
+        for image in images:
+            digest = hashlib.sha256(image).digest()
+            width, height = Image.open(io.BytesIO(image)).size
+            results.append({'predictions': [{
+                'x': width / 2, 'y': height / 2, 'width': width / 2, 'height': height / 2,
+                'confidence': round(0.5 + digest[0] / 512, 4),
+                'class': POTHOLE_CLASS,
+            }]})
+        return results
+
+
+# Boxes below this confidence are dropped before non-maximum suppression
+ONNX_MIN_CONFIDENCE = 0.25
+ONNX_IOU_THRESHOLD = 0.45
+ONNX_INPUT_SIZE = 640
+
+
+def letterbox(image, size=ONNX_INPUT_SIZE):
+    """
+    Scale an RGB image to fit a size x size square, padded with grey, as a
+    (3, size, size) float32 array in [0, 1]. Returns (array, scale, (pad_x, pad_y)).
+    """
+    scale = min(size / image.width, size / image.height)
+    resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+    canvas = Image.new('RGB', (size, size), (114, 114, 114))
+    pad = ((size - resized.width) // 2, (size - resized.height) // 2)
+    canvas.paste(resized, pad)
+    array = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return array, scale, pad
+
+
+def non_max_suppression(boxes, scores, iou_threshold=ONNX_IOU_THRESHOLD):
+    """Indices of the boxes (x1, y1, x2, y2) kept by greedy NMS, best first"""
+    order = np.argsort(-scores)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+        width = np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+        height = np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None)
+        overlap = width * height
+        iou = overlap / (areas[best] + areas[rest] - overlap + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return keep
+
+
+def yolo_predictions(output, scale, pad, class_names, min_confidence=ONNX_MIN_CONFIDENCE):
+    """
+    Roboflow-style predictions from one image's YOLOv8 output, an array of
+    (4 + classes, anchors) rows: box centre and size in input pixels, then
+    one score per class. Boxes are mapped back to the pixels of the image
+    before letterboxing.
+    """
+    output = np.asarray(output, dtype=np.float32)
+    scores = output[4:].T
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(class_ids)), class_ids]
+    selected = confidences >= min_confidence
+    centres = output[:4].T[selected]
+    class_ids, confidences = class_ids[selected], confidences[selected]
+
+    x = (centres[:, 0] - pad[0]) / scale
+    y = (centres[:, 1] - pad[1]) / scale
+    width, height = centres[:, 2] / scale, centres[:, 3] / scale
+    corners = np.stack([x - width / 2, y - height / 2, x + width / 2, y + height / 2], axis=1)
+
+    predictions = []
+    for class_id in np.unique(class_ids):
+        members = np.flatnonzero(class_ids == class_id)
+        for index in members[non_max_suppression(corners[members], confidences[members])]:
+            predictions.append({
+                'x': float(x[index]), 'y': float(y[index]),
+                'width': float(width[index]), 'height': float(height[index]),
+                'confidence': float(confidences[index]),
+                'class': class_names[class_id] if class_id < len(class_names) else str(class_id),
+            })
+    predictions.sort(key=lambda prediction: prediction['confidence'], reverse=True)
+    return predictions
+
+
+class OnnxDetector(Detector):
+    """A YOLOv8 pothole model exported to ONNX, run locally on the CPU"""
+
+    def __init__(self, model_path=None, class_names=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImproperlyConfigured('The onnx detector backend needs the onnxruntime package') from e
+
+        model_path = model_path or settings.DETECTOR_ONNX_MODEL
+        self.session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Models exported with a fixed batch size of 1 are run once per image
+        self.batched = not isinstance(model_input.shape[0], int) or model_input.shape[0] != 1
+        self.class_names = class_names or settings.DETECTOR_ONNX_CLASSES
+        self.model_version = f'onnx/{os.path.basename(model_path)}'
+
+    def detect_batch(self, images):
+        prepared = [letterbox(Image.open(io.BytesIO(image)).convert('RGB')) for image in images]
+        if not prepared:
+            return []
+        batch = np.stack([array for array, _, _ in prepared])
+        if self.batched:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: row[None]})[0] for row in batch])
+        return [
+            {'predictions': yolo_predictions(output, scale, pad, self.class_names)}
+            for output, (_, scale, pad) in zip(outputs, prepared)
+        ]
+
+
+BACKENDS = {
+    'roboflow': RoboflowDetector,
+    'onnx': OnnxDetector,
+    'stub': StubDetector,
+}
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_detector(backend=None):
+    """The detector for a backend name (DETECTOR_BACKEND by default), created once per process; None for 'none'"""
+    backend = backend or settings.DETECTOR_BACKEND
+    if backend == 'none':
+        return None
+    with _detectors_lock:
+        if backend not in _detectors:
+            detector_class = BACKENDS.get(backend) or import_string(backend)
+            _detectors[backend] = detector_class()
+    return _detectors[backend]
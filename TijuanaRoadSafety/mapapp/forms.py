@@ -1,6 +1,37 @@
 from django import forms
 from .models import PotholeReport
 from django.core.exceptions import ValidationError
+from PIL import Image
+
+from .images import DecodedImage
+
+
+class PhotoField(forms.ImageField):
+    """
+    An ImageField that validates the upload by decoding it into a
+    DecodedImage, attached to the file as .decoded so later stages reuse it
+    instead of decoding the upload again. Uploads already refused by
+    ImageUploadHandler fail with the handler's reason.
+    """
+
+    def to_python(self, data):
+        upload_error = getattr(data, 'upload_error', None)
+        if upload_error:
+            raise ValidationError(upload_error, code='invalid_image')
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+        try:
+            decoded = DecodedImage.from_file(f)
+        except Exception as exc:
+            raise ValidationError(
+                self.error_messages['invalid_image'], code='invalid_image'
+            ) from exc
+        f.decoded = decoded
+        f.image = decoded.image
+        f.content_type = Image.MIME.get(decoded.format)
+        return f
+
 
 class PotholeReportForm(forms.ModelForm):
     phone_number = forms.CharField(max_length=15, required=False, label="Número de Teléfono (opcional)",
@@ -14,7 +45,7 @@ class PotholeReportForm(forms.ModelForm):
     latitude = forms.FloatField(widget = forms.HiddenInput())  # Latitude of the pothole location
     longitude = forms.FloatField(widget = forms.HiddenInput())  # Longitude of the pothole location
     approximate_address = forms.CharField(max_length=255, required=False, widget=forms.HiddenInput())  # Address from geocoding
-    image = forms.ImageField(required = True, label = "Subir Imagen", help_text = "Por favor, envíe únicamente archivos .jpg o .png.")  # Image submission
+    image = PhotoField(required = True, label = "Subir Imagen", help_text = "Por favor, envíe únicamente archivos .jpg o .png.")  # Image submission
 
     class Meta:
         model = PotholeReport
@@ -43,7 +74,7 @@ class AuditReportForm(forms.Form):
         required=True,
         label="Número de Teléfono"
     )
-    image = forms.ImageField(label="Suba una imagen del bache reparado")
+    image = PhotoField(label="Suba una imagen del bache reparado")
 
     def clean_image(self):
         image = self.cleaned_data.get('image')
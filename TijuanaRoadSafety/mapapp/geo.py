@@ -0,0 +1,253 @@
+"""
+Spatial helpers for pothole reports (geohash encoding, grid lookups and
+vectorized distance calculations)
+"""
+import math
+
+import numpy as np
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells, stored on every report
+METERS_PER_DEGREE = 111320  # Length of one degree of latitude
+EARTH_RADIUS_METERS = 6371000
+
+# Largest number of pairwise distances computed at once by the matrix helpers.
+# Each intermediate array is DISTANCE_CHUNK_ELEMENTS * 8 bytes (~8MB).
+DISTANCE_CHUNK_ELEMENTS = 1_000_000
+
+# Upper bound on the relative error of the equirectangular approximation
+# against haversine for any two points inside the Tijuana metro area (lat
+# 32.3-32.7, lon -117.2 to -116.7, up to ~60km apart). The measured worst case
+# is ~2.7e-6, i.e. under 0.2m at 60km and far below GPS noise at 50m.
+EQUIRECTANGULAR_MAX_RELATIVE_ERROR = 1e-5
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string of the given length"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """Return the (height, width) of a geohash cell in degrees"""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def precision_for_radius(latitude, radius_meters):
+    """
+    Pick the finest geohash precision whose cells are at least as large as the
+    search radius, so a cell plus its eight neighbours covers the whole circle.
+    """
+    lat_degrees = radius_meters / METERS_PER_DEGREE
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    lon_degrees = radius_meters / (METERS_PER_DEGREE * cos_lat)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_height, cell_width = geohash_cell_size(precision)
+        if cell_height >= lat_degrees and cell_width >= lon_degrees:
+            return precision
+    return 1
+
+
+def geohash_neighbours(latitude, longitude, precision):
+    """Return the geohash of the cell containing the point plus its eight neighbours"""
+    cell_height, cell_width = geohash_cell_size(precision)
+    cells = []
+    for d_lat in (-1, 0, 1):
+        for d_lon in (-1, 0, 1):
+            lat = min(max(latitude + d_lat * cell_height, -90.0), 90.0)
+            lon = (longitude + d_lon * cell_width + 180.0) % 360.0 - 180.0
+            cell = geohash_encode(lat, lon, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def geohash_prefix_range(prefix):
+    """
+    Return (lower, upper) bounds matching every geohash that starts with prefix.
+
+    A range comparison can use a plain B-tree index on both SQLite and
+    PostgreSQL, unlike LIKE 'prefix%'. upper is None when no bound is needed.
+    """
+    chars = list(prefix)
+    while chars:
+        index = GEOHASH_ALPHABET.index(chars[-1])
+        if index + 1 < len(GEOHASH_ALPHABET):
+            chars[-1] = GEOHASH_ALPHABET[index + 1]
+            return prefix, ''.join(chars)
+        chars.pop()
+    return prefix, None
+
+
+def point_distance(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in meters between two points given in degrees.
+
+    Plain math for a single pair, several times faster than going through
+    NumPy; use haversine_distance for arrays.
+    """
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    half_delta_lat = (lat2_rad - lat1_rad) / 2
+    half_delta_lon = math.radians(lon2 - lon1) / 2
+
+    a = (math.sin(half_delta_lat) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(half_delta_lon) ** 2)
+    return 2 * EARTH_RADIUS_METERS * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in meters between points given in degrees.
+
+    Accepts scalars or NumPy arrays; arrays are broadcast against each other.
+    """
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    half_delta_lat = (lat2 - lat1) / 2
+    half_delta_lon = np.radians(np.subtract(lon2, lon1)) / 2
+
+    a = (np.sin(half_delta_lat) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin(half_delta_lon) ** 2)
+    return 2 * EARTH_RADIUS_METERS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def equirectangular_distance(lat1, lon1, lat2, lon2):
+    """
+    Fast planar approximation of the distance in meters between points.
+
+    Good for city-scale distances, see EQUIRECTANGULAR_MAX_RELATIVE_ERROR.
+    """
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    x = np.radians(np.subtract(lon2, lon1)) * np.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return EARTH_RADIUS_METERS * np.sqrt(x * x + y * y)
+
+
+DISTANCE_METHODS = {
+    'haversine': haversine_distance,
+    'equirectangular': equirectangular_distance,
+}
+
+
+def _distance_function(method):
+    try:
+        return DISTANCE_METHODS[method]
+    except KeyError:
+        raise ValueError(f"Unknown distance method: {method}") from None
+
+
+def distances_from_point(latitude, longitude, latitudes, longitudes, method='haversine'):
+    """Distances in meters from one point to every point in the given arrays"""
+    distance = _distance_function(method)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    return distance(latitude, longitude, latitudes, longitudes)
+
+
+def iter_distance_blocks(lats1, lons1, lats2, lons2, method='haversine',
+                         chunk_elements=DISTANCE_CHUNK_ELEMENTS):
+    """
+    Yield (row_slice, block) pairs covering the full distance matrix between
+    two point sets, where block holds the distances for rows[row_slice].
+
+    Only one block of at most chunk_elements distances is alive at a time, so
+    callers that reduce each block (e.g. counting pairs under a threshold)
+    never need the full N x M matrix in memory.
+    """
+    distance = _distance_function(method)
+    lats1 = np.asarray(lats1, dtype=np.float64)
+    lons1 = np.asarray(lons1, dtype=np.float64)
+    lats2 = np.asarray(lats2, dtype=np.float64)
+    lons2 = np.asarray(lons2, dtype=np.float64)
+
+    rows_per_block = max(1, chunk_elements // max(len(lats2), 1))
+    for start in range(0, len(lats1), rows_per_block):
+        rows = slice(start, min(start + rows_per_block, len(lats1)))
+        block = distance(
+            lats1[rows, np.newaxis], lons1[rows, np.newaxis],
+            lats2[np.newaxis, :], lons2[np.newaxis, :],
+        )
+        yield rows, block
+
+
+def distance_matrix(lats1, lons1, lats2, lons2, method='haversine',
+                    chunk_elements=DISTANCE_CHUNK_ELEMENTS):
+    """Full N x M matrix of distances in meters, computed block by block"""
+    result = np.empty((len(lats1), len(lats2)), dtype=np.float64)
+    for rows, block in iter_distance_blocks(lats1, lons1, lats2, lons2, method, chunk_elements):
+        result[rows] = block
+    return result
+
+
+def mercator(latitude, longitude):
+    """
+    Project degrees to normalized Web Mercator coordinates in [0, 1), with x
+    growing east and y growing south, as used by slippy-map tiles.
+    """
+    x = (np.asarray(longitude, dtype=np.float64) + 180.0) / 360.0
+    sin_lat = np.clip(np.sin(np.radians(latitude)), -0.9999, 0.9999)
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+def tile_bounds(zoom, x, y):
+    """(south, west, north, east) in degrees of slippy-map tile zoom/x/y"""
+    n = 1 << zoom
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_range(zoom, bbox):
+    """(x_min, y_min, x_max, y_max) of the slippy-map tiles at zoom covering bbox (south, west, north, east)"""
+    south, west, north, east = bbox
+    n = 1 << zoom
+    x_min, y_min = mercator(north, west)
+    x_max, y_max = mercator(south, east)
+    return int(x_min * n), int(y_min * n), int(x_max * n), int(y_max * n)
+
+
+def tile_range_bounds(zoom, x_min, y_min, x_max, y_max):
+    """(south, west, north, east) in degrees of a range of tiles returned by tile_range"""
+    _, west, north, _ = tile_bounds(zoom, x_min, y_min)
+    south, _, _, east = tile_bounds(zoom, x_max, y_max)
+    return south, west, north, east
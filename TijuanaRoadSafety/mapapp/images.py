@@ -0,0 +1,181 @@
+"""
+Resized copies of report photos.
+
+Originals can be multi-megabyte PNG screenshots or full-resolution phone
+photos, so pages and APIs show derivatives sized for where they are used:
+a size-capped canonical copy for the report page and small and medium
+thumbnails for the leaderboard, the admin and the nearby-pothole API.
+
+Each upload is decoded once into a DecodedImage (see PhotoField in
+forms.py), which form validation, detection, perceptual hashing (see
+photo_index.py) and derivative generation all share, without temporary files.
+"""
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Derivative field -> longest side in pixels, largest first so each one can be
+# shrunk from the previous instead of from the original
+DERIVATIVE_SIZES = {
+    'image_large': 1600,
+    'image_medium': 320,
+    'image_small': 80,
+}
+
+DERIVATIVE_QUALITY = 82
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+# Bytes per pixel of the decoded image modes, for the memory estimate
+BYTES_PER_PIXEL = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+
+def fit_within(size, longest_side):
+    """The size an image of the given size is thumbnailed to for longest_side"""
+    width, height = size
+    scale = min(1, longest_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def pixel_bytes(image):
+    return image.width * image.height * BYTES_PER_PIXEL.get(image.mode, 4)
+
+
+class DecodedImage:
+    """
+    An uploaded photo decoded once and shared by every stage that needs its
+    pixels: form validation, detection and derivative generation.
+
+    JPEGs are decoded with Image.draft at the smallest DCT scale that still
+    covers the largest derivative, so a 12 MP phone photo is never expanded
+    to full resolution. peak_bytes estimates the most memory the photo held
+    at any point (encoded bytes plus pixel buffers plus encoded outputs).
+    """
+
+    def __init__(self, data):
+        self.data = data
+        image = Image.open(io.BytesIO(data))
+        self.format = image.format
+        self.original_size = image.size
+        if image.format == 'JPEG':
+            image.draft('RGB', fit_within(image.size, max(DERIVATIVE_SIZES.values())))
+        image.load()
+        self.peak_bytes = len(data) + pixel_bytes(image)
+        self.image = self._upright_rgb(image)
+        self.peak_bytes = max(self.peak_bytes, len(data) + pixel_bytes(image) + pixel_bytes(self.image))
+        self._derivatives = {}
+
+    @classmethod
+    def from_file(cls, file):
+        """Read and decode a file, leaving it at the start for storage"""
+        file.seek(0)
+        data = file.read()
+        file.seek(0)
+        return cls(data)
+
+    @staticmethod
+    def _upright_rgb(image):
+        """Rotate according to EXIF orientation and convert to RGB"""
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # Flatten transparency onto white, as JPEG has no alpha channel
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            return background
+        return image.convert('RGB')
+
+    def derivatives(self, image_format=None):
+        """Every derivative encoded in image_format, as {field: bytes}; encoded once per format"""
+        image_format = image_format or settings.IMAGE_DERIVATIVE_FORMAT
+        if image_format not in self._derivatives:
+            rendered = {}
+            current = self.image
+            base = len(self.data) + pixel_bytes(self.image)
+            for field, size in DERIVATIVE_SIZES.items():
+                current = current.copy()
+                current.thumbnail((size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                current.save(buffer, format=image_format, quality=DERIVATIVE_QUALITY)
+                rendered[field] = buffer.getvalue()
+                self.peak_bytes = max(
+                    self.peak_bytes, base + pixel_bytes(current) + sum(map(len, rendered.values()))
+                )
+            self._derivatives[image_format] = rendered
+        return self._derivatives[image_format]
+
+    def detection_jpeg(self):
+        """The image sent to the detector: the large derivative as JPEG"""
+        return self.derivatives('JPEG')['image_large']
+
+    def image_hash(self):
+        return difference_hash(self.image)
+
+
+def difference_hash(image):
+    """
+    64-bit dHash of an image as 16 hex digits: one bit per horizontally
+    adjacent pixel pair of a 9x8 grayscale thumbnail, set where brightness
+    falls from left to right
+    """
+    pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = bits << 1 | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return f'{bits:016x}'
+
+
+def hash_file(source):
+    """
+    dHash of an image file, decoded and normalized as uploads are (see
+    DecodedImage), so a stored photo hashes as it did when it was submitted
+    """
+    return DecodedImage.from_file(source).image_hash()
+
+
+def decode_or_none(source, name):
+    """decode(source), or None with a warning when it is not a readable image"""
+    try:
+        return decode(source)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not decode image {name}: {e}")
+        return None
+
+
+def decode(source):
+    """A DecodedImage for source, reusing the one made when the upload was validated"""
+    if isinstance(source, DecodedImage):
+        return source
+    decoded = getattr(source, 'decoded', None)
+    return decoded if decoded is not None else DecodedImage.from_file(source)
+
+
+def attach_derivatives(report, source):
+    """
+    Generate the derivatives of source (an open image file or a DecodedImage)
+    and store them on report's derivative fields without saving the report.
+    Returns False and leaves the fields alone when source cannot be decoded.
+    """
+    decoded = decode_or_none(source, report.image.name)
+    if decoded is None:
+        return False
+    rendered = decoded.derivatives()
+    logger.info(
+        f"Image {report.image.name}: {decoded.format} {decoded.original_size[0]}x{decoded.original_size[1]} "
+        f"decoded at {decoded.image.width}x{decoded.image.height}, peak ~{decoded.peak_bytes / 2**20:.1f} MiB"
+    )
+
+    stem = os.path.splitext(os.path.basename(report.image.name))[0]
+    extension = EXTENSIONS[settings.IMAGE_DERIVATIVE_FORMAT]
+    for field, content in rendered.items():
+        suffix = field.replace('image_', '')
+        getattr(report, field).save(f'{stem}_{suffix}.{extension}', ContentFile(content), save=False)
+    return True
@@ -0,0 +1,83 @@
+"""
+Detection results cached by image content.
+
+The detector sees the same photo more than once: WhatsApp users re-send
+media, and a report can be validated again. detect_potholes keys each image by
+the SHA-256 of the JPEG sent to the detector (DecodedImage.detection_jpeg,
+which encodes the same photo to the same bytes) and the detector's model
+version, and
+keeps results in the DetectionResult table so every worker shares them.
+Failed calls are never cached.
+
+Hits, misses and the time spent on missed calls are counted in the shared
+cache; `python manage.py detection_cache` shows them together with the quota
+and latency the hits saved.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from .caching import increment_counter
+from .detectors import get_detector
+from .models import DetectionResult
+
+HITS_KEY = 'mapapp:detection-cache:hits'
+MISSES_KEY = 'mapapp:detection-cache:misses'
+MISS_MILLISECONDS_KEY = 'mapapp:detection-cache:miss-ms'
+
+
+def image_digest(image):
+    return hashlib.sha256(image).hexdigest()
+
+
+def detect_potholes(images, detector=None):
+    """
+    One detector result per encoded JPEG, answering images seen before from
+    the cache and sending the rest to the detector (the configured one by
+    default) as one batch
+    """
+    detector = detector or get_detector()
+    digests = [image_digest(image) for image in images]
+    results = [DetectionResult.lookup(digest, detector.model_version) for digest in digests]
+    missing = [index for index, result in enumerate(results) if result is None]
+    if len(missing) < len(images):
+        increment_counter(HITS_KEY, len(images) - len(missing))
+    if not missing:
+        return results
+
+    started = time.monotonic()
+    detected = detector.detect_batch([images[index] for index in missing])
+    increment_counter(MISSES_KEY, len(missing))
+    increment_counter(MISS_MILLISECONDS_KEY, round((time.monotonic() - started) * 1000))
+    for index, result in zip(missing, detected):
+        results[index] = result
+        if 'error' not in result:
+            DetectionResult.store(digests[index], detector.model_version, result)
+    return results
+
+
+def detect_pothole(image):
+    """The detector result for one encoded JPEG, from the cache when the image was seen before"""
+    return detect_potholes([image])[0]
+
+
+def cache_stats():
+    """Counters of the detection cache, with the detector calls and time its hits saved"""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    miss_milliseconds = cache.get(MISS_MILLISECONDS_KEY, 0)
+    average_miss_seconds = miss_milliseconds / misses / 1000 if misses else 0.0
+    return {
+        'entries': DetectionResult.objects.count(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'average_miss_seconds': average_miss_seconds,
+        'saved_calls': hits,
+        'saved_seconds': hits * average_miss_seconds,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY, MISS_MILLISECONDS_KEY])
@@ -0,0 +1,36 @@
+"""
+Database locks that serialize work on the same spot of the map
+"""
+import hashlib
+
+from django.db import connection
+
+from . import geo
+
+
+def _advisory_key(name):
+    """Stable signed 64-bit key for pg_advisory_xact_lock"""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def lock_area(latitude, longitude, radius_meters):
+    """
+    Block concurrent transactions working within radius of the point until the
+    current transaction ends. Must be called inside transaction.atomic().
+
+    On PostgreSQL this takes transaction-scoped advisory locks on the geohash
+    cell of the point and its neighbours (in sorted order, so two overlapping
+    areas can never deadlock). Any two points within radius of each other share
+    at least one of those cells. SQLite needs nothing here: its transactions
+    are opened with BEGIN IMMEDIATE (see settings), which already serializes
+    writers.
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    precision = geo.precision_for_radius(latitude, radius_meters)
+    cells = sorted(geo.geohash_neighbours(latitude, longitude, precision))
+    with connection.cursor() as cursor:
+        for cell in cells:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [_advisory_key(f'pothole-area:{cell}')])
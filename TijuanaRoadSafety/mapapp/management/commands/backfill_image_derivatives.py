@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from mapapp.images import DERIVATIVE_SIZES, attach_derivatives
+from mapapp.models import PotholeReport
+
+
+def generate(report):
+    """Render and store one report's derivatives; runs in a worker thread without touching the database"""
+    try:
+        with report.image.open('rb') as source:
+            return attach_derivatives(report, source)
+    except OSError:
+        return False
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized copies of report photos for reports that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Reports to process in parallel')
+        parser.add_argument('--batch-size', type=int, default=100, help='Reports to load and save at a time')
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        reports = PotholeReport.objects.exclude(image='').only('id', 'image', *DERIVATIVE_SIZES).order_by('pk')
+        if not options['force']:
+            missing = Q()
+            for field in DERIVATIVE_SIZES:
+                missing |= Q(**{field: ''})
+            reports = reports.filter(missing)
+
+        batch_size = options['batch_size']
+        done = failed = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            while True:
+                batch = list(reports.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                generated = [report for report, ok in zip(batch, executor.map(generate, batch)) if ok]
+                # Only the derivative columns are written, so report timestamps stay as they were
+                PotholeReport.objects.bulk_update(generated, list(DERIVATIVE_SIZES))
+                done += len(generated)
+                failed += len(batch) - len(generated)
+                self.stdout.write(f'{done} reports processed, {failed} failed')
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f'Generated derivatives for {done} reports, {failed} could not be read'))
@@ -0,0 +1,96 @@
+import json
+import random
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mapapp.conversations import get_conversation_store
+
+# Benchmark conversations use numbers no real sender has
+NUMBER_PREFIX = '+000'
+
+
+def sample_state(step, rng):
+    """A conversation state as it looks after a given number of steps"""
+    state = {'first_message_sent': True, 'submission': {}}
+    if step >= 1:
+        state['submission']['image_url'] = f'https://api.twilio.com/2010-04-01/Accounts/AC{rng.randrange(10**16)}/Messages/MM{rng.randrange(10**16)}/Media/ME{rng.randrange(10**16)}'
+        state['submission']['ai_confidence'] = round(rng.uniform(0.8, 1), 4)
+    if step >= 2:
+        state['submission']['latitude'] = f'{rng.uniform(32.4, 32.6):.6f}'
+        state['submission']['longitude'] = f'{rng.uniform(-117.1, -116.8):.6f}'
+    return state
+
+
+class Command(BaseCommand):
+    help = 'Measure WhatsApp conversation store throughput with many concurrent conversations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=None, help='Conversation store (default: WHATSAPP_STATE_BACKEND)')
+        parser.add_argument('--conversations', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--steps', type=int, default=4, help='Transitions per conversation')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        backend = options['backend'] or settings.WHATSAPP_STATE_BACKEND
+        store = get_conversation_store(backend)
+        numbers = [f'{NUMBER_PREFIX}{index:09}' for index in range(options['conversations'])]
+        # Every thread walks all conversations in its own order, so the same
+        # conversation is regularly updated by two threads at once
+        work = numbers * options['steps']
+        rng = random.Random(options['seed'])
+        shares = [work[index::options['threads']] for index in range(options['threads'])]
+        for share in shares:
+            rng.shuffle(share)
+
+        latencies = []
+        conflicts = []
+        lock = threading.Lock()
+
+        def run(share, seed):
+            close_old_connections()
+            thread_rng = random.Random(seed)
+            local_latencies, local_conflicts = [], 0
+            try:
+                for number in share:
+                    started = time.perf_counter()
+                    while True:
+                        state, version = store.load(number)
+                        state.update(sample_state(version % 3, thread_rng))
+                        if store.compare_and_set(number, state, version):
+                            break
+                        local_conflicts += 1
+                    local_latencies.append(time.perf_counter() - started)
+            finally:
+                close_old_connections()
+            with lock:
+                latencies.extend(local_latencies)
+                conflicts.append(local_conflicts)
+
+        threads = [threading.Thread(target=run, args=(share, index)) for index, share in enumerate(shares)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        sizes = [len(json.dumps(store.load(number)[0])) for number in numbers[:100]]
+        for number in numbers:
+            store.delete(number)
+
+        milliseconds = np.array(latencies) * 1000
+        self.stdout.write(
+            f'{backend}: {len(numbers)} conversations, {len(latencies)} transitions on {len(threads)} threads '
+            f'in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} transitions/s)'
+        )
+        self.stdout.write(
+            f'  latency: p50 {np.percentile(milliseconds, 50):.2f} ms, p99 {np.percentile(milliseconds, 99):.2f} ms; '
+            f'{sum(conflicts)} compare-and-set conflicts retried'
+        )
+        self.stdout.write(f'  state: {np.mean(sizes):.0f} bytes of JSON per conversation')
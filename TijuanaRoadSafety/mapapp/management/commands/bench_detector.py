@@ -0,0 +1,59 @@
+import io
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from mapapp.detectors import get_detector
+from mapapp.images import DERIVATIVE_QUALITY, DERIVATIVE_SIZES
+
+
+def synthetic_photos(count, seed):
+    """JPEGs the size of the images sent to the detector, with smooth random content"""
+    rng = np.random.default_rng(seed)
+    side = DERIVATIVE_SIZES['image_large']
+    photos = []
+    for _ in range(count):
+        coarse = Image.fromarray(rng.integers(0, 256, (12, 16, 3), dtype=np.uint8))
+        buffer = io.BytesIO()
+        coarse.resize((side, side * 3 // 4), Image.BILINEAR).save(buffer, format='JPEG', quality=DERIVATIVE_QUALITY)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+class Command(BaseCommand):
+    help = 'Measure detector throughput on synthetic photos, bypassing the detection cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=None, help='Detector backend (default: DETECTOR_BACKEND)')
+        parser.add_argument('--images', type=int, default=64)
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        backend = options['backend'] or settings.DETECTOR_BACKEND
+        detector = get_detector(backend)
+        if detector is None:
+            raise CommandError("No detector is configured; pass --backend or set DETECTOR_BACKEND")
+
+        photos = synthetic_photos(options['images'], options['seed'])
+        self.stdout.write(
+            f'{backend} ({detector.model_version}): {len(photos)} photos, '
+            f'{sum(map(len, photos)) / len(photos) / 1024:.0f} KiB on average'
+        )
+        detector.detect_batch(photos[:1])
+
+        for batch_size in options['batch_sizes']:
+            errors = 0
+            started = time.perf_counter()
+            for start in range(0, len(photos), batch_size):
+                results = detector.detect_batch(photos[start:start + batch_size])
+                errors += sum('error' in result for result in results)
+            elapsed = time.perf_counter() - started
+            batches = -(-len(photos) // batch_size)
+            self.stdout.write(
+                f'  batch {batch_size:>3}: {len(photos) / elapsed:8.1f} images/s, '
+                f'{elapsed / batches * 1000:8.1f} ms per batch, {errors} errors'
+            )
@@ -0,0 +1,83 @@
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from mapapp import geo
+from mapapp.models import PotholeReport
+
+# Rough bounding box of the Tijuana metro area
+TIJUANA_BOUNDS = (32.40, 32.60, -117.13, -116.85)
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    """The original math-based implementation, kept as a baseline"""
+    R = 6371000
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+    a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(delta_lon/2) * math.sin(delta_lon/2))
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark scalar vs vectorized distance calculations on synthetic Tijuana points'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[100, 1000, 3000],
+            help='Number of points N; each run computes an N x N distance matrix',
+        )
+        parser.add_argument(
+            '--scalar-limit',
+            type=int,
+            default=1000,
+            help='Skip the scalar loops above this N (they are quadratic in pure Python)',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        south, north, west, east = TIJUANA_BOUNDS
+
+        self.stdout.write(f"{'N':>8} {'method':<28} {'seconds':>10} {'pairs/s':>14}")
+        for n in options['sizes']:
+            lats = rng.uniform(south, north, n)
+            lons = rng.uniform(west, east, n)
+            pairs = n * n
+
+            if n <= options['scalar_limit']:
+                lat_list, lon_list = lats.tolist(), lons.tolist()
+                self._run(n, pairs, 'math loop (baseline)', lambda: [
+                    scalar_haversine(a, b, c, d)
+                    for a, b in zip(lat_list, lon_list)
+                    for c, d in zip(lat_list, lon_list)
+                ])
+                self._run(n, pairs, 'calculate_distance loop', lambda: [
+                    PotholeReport.calculate_distance(a, b, c, d)
+                    for a, b in zip(lat_list, lon_list)
+                    for c, d in zip(lat_list, lon_list)
+                ])
+
+            haversine = self._run(n, pairs, 'distance_matrix haversine',
+                                  lambda: geo.distance_matrix(lats, lons, lats, lons))
+            fast = self._run(n, pairs, 'distance_matrix equirect.',
+                             lambda: geo.distance_matrix(lats, lons, lats, lons, 'equirectangular'))
+
+            mask = haversine > 1
+            error = np.max(np.abs(fast[mask] - haversine[mask]) / haversine[mask]) if mask.any() else 0.0
+            self.stdout.write(f"{'':>8} equirectangular max relative error: {error:.2e}")
+
+    def _run(self, n, pairs, label, func):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{n:>8} {label:<28} {elapsed:>10.4f} {pairs / elapsed:>14,.0f}")
+        return result
@@ -0,0 +1,108 @@
+import gzip
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+
+from mapapp import packing
+from mapapp.management.commands.bench_distance import TIJUANA_BOUNDS
+from mapapp.snapshot import STATUS_CODES, ReportSnapshot
+
+NODE_HARNESS = '''
+const fs = require('fs');
+%(decoder)s
+const data = fs.readFileSync(process.argv[2]);
+const buffer = data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength);
+decodePackedPoints(buffer);
+const repeats = %(repeats)d;
+const start = process.hrtime.bigint();
+let features;
+for (let i = 0; i < repeats; i++) {
+    features = decodePackedPoints(buffer);
+}
+const elapsed = Number(process.hrtime.bigint() - start) / 1e6 / repeats;
+console.log(JSON.stringify({ms: elapsed, count: features.length}));
+'''
+
+
+class Command(BaseCommand):
+    help = 'Compare payload size and decode time of the map point formats on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+        parser.add_argument('--repeats', type=int, default=10, help='Decodes timed per format')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        south, north, west, east = TIJUANA_BOUNDS
+        repeats = options['repeats']
+        decoder = re.sub(r'</?script>', '', get_template('map_points_decoder.html').template.source)
+        node = shutil.which('node')
+
+        for n in options['sizes']:
+            # GPS fixes as the phones report them, to six decimals
+            snapshot = ReportSnapshot.from_arrays(
+                np.arange(1, n + 1),
+                np.round(rng.uniform(south, north, n), 6),
+                np.round(rng.uniform(west, east, n), 6),
+                rng.integers(1, 6, n),
+                rng.integers(1, 4, n),
+                rng.integers(0, len(STATUS_CODES), n),
+            )
+            columns = snapshot.rows(snapshot.mask())
+
+            legacy = ',\n'.join(
+                '{ lat: %r, lng: %r, severity: %d, id: %d }' % row
+                for row in zip(columns['latitude'].tolist(), columns['longitude'].tolist(),
+                               columns['severity'].tolist(), columns['id'].tolist())
+            ).encode()
+            geojson = json.dumps({'type': 'FeatureCollection', 'features': snapshot.features(columns)}).encode()
+
+            start = time.perf_counter()
+            packed = packing.encode(
+                columns['id'], columns['latitude'], columns['longitude'],
+                columns['submission_count'], columns['severity'], columns['status'],
+            )
+            encode_ms = (time.perf_counter() - start) * 1000
+
+            self.stdout.write(f'\n{n:,} points')
+            self.stdout.write(f'  {"format":<16} {"bytes/point":>12} {"gzip bytes/point":>17}')
+            for label, body in (('JS literal', legacy), ('GeoJSON', geojson), ('packed', packed)):
+                self.stdout.write(
+                    f'  {label:<16} {len(body) / n:12.1f} {len(gzip.compress(body)) / n:17.1f}'
+                )
+
+            self.stdout.write(f'  packed encode (python):  {encode_ms:8.1f} ms')
+            self.stdout.write(f'  packed decode (python):  {self._time(lambda: packing.decode(packed), repeats):8.1f} ms')
+            self.stdout.write(f'  GeoJSON parse (python):  {self._time(lambda: json.loads(geojson), repeats):8.1f} ms')
+
+            if node:
+                result = self._node_decode(node, decoder, packed, repeats)
+                self.stdout.write(f'  packed decode (node):    {result["ms"]:8.1f} ms')
+            else:
+                self.stdout.write(self.style.WARNING('  node not found, skipping the JavaScript decoder'))
+
+    def _time(self, func, repeats):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            func()
+        return (time.perf_counter() - start) / repeats * 1000
+
+    def _node_decode(self, node, decoder, packed, repeats):
+        with tempfile.TemporaryDirectory() as directory:
+            payload = os.path.join(directory, 'points.bin')
+            script = os.path.join(directory, 'decode.js')
+            with open(payload, 'wb') as f:
+                f.write(packed)
+            with open(script, 'w') as f:
+                f.write(NODE_HARNESS % {'decoder': decoder, 'repeats': repeats})
+            output = subprocess.run([node, script, payload], capture_output=True, text=True, check=True)
+        return json.loads(output.stdout)
@@ -0,0 +1,81 @@
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from mapapp.management.commands.bench_distance import TIJUANA_BOUNDS
+from mapapp.snapshot import STATUS_CODES, ReportSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Benchmark memory and query latency of the report snapshot on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=200, help='Queries timed per operation')
+        parser.add_argument(
+            '--compare-limit',
+            type=int,
+            default=100_000,
+            help='Also measure a list of per-report tuples up to this size',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        south, north, west, east = TIJUANA_BOUNDS
+        queries = options['queries']
+
+        for n in options['sizes']:
+            ids = np.arange(1, n + 1)
+            latitudes = rng.uniform(south, north, n)
+            longitudes = rng.uniform(west, east, n)
+            severities = rng.integers(1, 6, n)
+            counts = rng.integers(1, 20, n)
+            statuses = rng.integers(0, len(STATUS_CODES), n)
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            snapshot = ReportSnapshot.from_arrays(ids, latitudes, longitudes, severities, counts, statuses)
+            build = time.perf_counter() - start
+            total_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            self.stdout.write(f'\n{n:,} reports')
+            self.stdout.write(f'  build:                 {build * 1000:10.1f} ms')
+            self.stdout.write(f'  arrays:                {snapshot.nbytes / 1e6:10.1f} MB '
+                              f'({snapshot.nbytes / n:.0f} bytes/report)')
+            self.stdout.write(f'  traced allocations:    {total_bytes / 1e6:10.1f} MB '
+                              f'({total_bytes / n:.0f} bytes/report)')
+
+            if n <= options['compare_limit']:
+                tracemalloc.start()
+                rows = list(zip(ids.tolist(), latitudes.tolist(), longitudes.tolist(),
+                                severities.tolist(), counts.tolist(), statuses.tolist()))
+                tuples_bytes = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                del rows
+                self.stdout.write(f'  python tuples:         {tuples_bytes / 1e6:10.1f} MB '
+                                  f'({tuples_bytes / n:.0f} bytes/report)')
+
+            points = list(zip(rng.uniform(south, north, queries), rng.uniform(west, east, queries)))
+            self._time('radius 50m', queries, lambda i: snapshot.within_radius(*points[i], 50))
+            self._time('radius 1km', queries, lambda i: snapshot.within_radius(*points[i], 1000))
+            self._time('status + severity', queries,
+                       lambda i: snapshot.mask(statuses=['pending', 'verified'], min_severity=3))
+            self._time('viewport bbox', queries, lambda i: snapshot.rows(snapshot.mask(
+                bbox=(points[i][0], points[i][1], points[i][0] + 0.02, points[i][1] + 0.02)
+            )))
+
+            start = time.perf_counter()
+            for report_id in range(n + 1, n + 1 + queries):
+                snapshot._upsert(report_id, 32.5, -117.0, 3, 1, 'pending')
+            self.stdout.write(f'  incremental upsert:    {(time.perf_counter() - start) / queries * 1e6:10.1f} us')
+
+    def _time(self, label, queries, func):
+        start = time.perf_counter()
+        for i in range(queries):
+            func(i)
+        elapsed = (time.perf_counter() - start) / queries
+        self.stdout.write(f'  {label + ":":<22} {elapsed * 1000:10.3f} ms')
@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mapapp.images import hash_file
+from mapapp.models import PotholeReport
+from mapapp.photo_index import BKTree, rebuild_photo_indexes
+
+
+def compute_hash(report):
+    """Hash one report's photo; runs in a worker thread without touching the database"""
+    try:
+        with report.image.open('rb') as source:
+            return hash_file(source)
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Compute perceptual hashes of report photos and rebuild the photo index of every worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Photos to hash in parallel')
+        parser.add_argument('--batch-size', type=int, default=200, help='Reports to load and save at a time')
+        parser.add_argument('--force', action='store_true', help='Rehash photos that already have a hash')
+
+    def handle(self, *args, **options):
+        reports = PotholeReport.objects.exclude(image='').only('id', 'image', 'image_hash').order_by('pk')
+        if not options['force']:
+            reports = reports.filter(image_hash='')
+
+        batch_size = options['batch_size']
+        done = failed = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            while True:
+                batch = list(reports.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                hashed = []
+                for report, image_hash in zip(batch, executor.map(compute_hash, batch)):
+                    if image_hash is not None:
+                        report.image_hash = image_hash
+                        hashed.append(report)
+                PotholeReport.objects.bulk_update(hashed, ['image_hash'])
+                done += len(hashed)
+                failed += len(batch) - len(hashed)
+                self.stdout.write(f'{done} photos hashed, {failed} failed')
+
+        rebuild_photo_indexes()
+
+        # Count photos that match one uploaded earlier, as the submission path would see them
+        tree = BKTree()
+        repeated = 0
+        for pk, image_hash in PotholeReport.objects.exclude(image_hash='').order_by('pk').values_list('pk', 'image_hash'):
+            value = int(image_hash, 16)
+            if tree.search(value, settings.PHOTO_MATCH_MAX_DISTANCE):
+                repeated += 1
+            tree.add(value, pk)
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(
+            f'Hashed {done} photos, {failed} could not be read; '
+            f'{tree.size} photos indexed, {repeated} of them repeat an earlier upload'
+        ))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mapapp.conversations import get_conversation_store
+
+
+class Command(BaseCommand):
+    help = 'Delete WhatsApp conversations that expired; run periodically with the database store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=None, help='Conversation store (default: WHATSAPP_STATE_BACKEND)')
+
+    def handle(self, *args, **options):
+        backend = options['backend'] or settings.WHATSAPP_STATE_BACKEND
+        deleted = get_conversation_store(backend).cleanup()
+        if backend == 'cache':
+            self.stdout.write('Conversations in the cache expire on their own')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired conversations'))
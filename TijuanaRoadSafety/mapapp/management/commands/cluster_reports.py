@@ -0,0 +1,90 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from mapapp.caching import invalidate_reports
+from mapapp.clustering import MergeIndex
+from mapapp.models import PotholeRanking, PotholeReport
+
+
+class Command(BaseCommand):
+    help = 'Fold duplicate reports that passed detection or review into the pothole they were made about, in one pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--radius',
+            type=float,
+            default=None,
+            help='Merge radius in meters (defaults to POTHOLE_MERGE_RADIUS_METERS)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many reports would be folded without making changes',
+        )
+
+    def handle(self, *args, **options):
+        radius = options['radius'] or settings.POTHOLE_MERGE_RADIUS_METERS
+        start = time.perf_counter()
+
+        # Only reports submit() would merge into; others stay for review
+        rows = list(
+            PotholeReport.objects.filter(PotholeReport.merge_targets())
+            .order_by('id')
+            .values_list('id', 'latitude', 'longitude', 'submission_count', 'latest_submission_date')
+        )
+        if not rows:
+            self.stdout.write(self.style.SUCCESS('No reports to fold'))
+            return
+
+        index = MergeIndex(radius, max(abs(row[1]) for row in rows))
+        duplicates = defaultdict(list)
+        for row in rows:
+            target = index.add(row[0], row[1], row[2])
+            if target is not None:
+                duplicates[target].append(row)
+
+        folded = sum(len(group) for group in duplicates.values())
+        self.stdout.write(
+            f'{len(rows)} reports fold into {len(index)} potholes '
+            f'(radius {radius:g}m, {time.perf_counter() - start:.2f}s)'
+        )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes were made'))
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            for target, group in duplicates.items():
+                ids = [row[0] for row in group]
+                submissions = sum(row[3] for row in group)
+                latest = max((row[4] for row in group if row[4] is not None), default=None)
+
+                PotholeReport.objects.filter(pk__in=ids).update(
+                    status='duplicate', duplicate_of=target, last_updated=now
+                )
+                PotholeRanking.objects.filter(report_id__in=ids).update(status='duplicate')
+
+                PotholeReport.objects.filter(pk=target).update(
+                    submission_count=F('submission_count') + submissions, last_updated=now
+                )
+                PotholeRanking.objects.filter(report_id=target).update(
+                    submission_count=F('submission_count') + submissions
+                )
+                if latest is not None:
+                    PotholeReport.objects.filter(pk=target, latest_submission_date__lt=latest).update(
+                        latest_submission_date=latest
+                    )
+                    PotholeRanking.objects.filter(report_id=target, latest_submission_date__lt=latest).update(
+                        latest_submission_date=latest
+                    )
+            # update() sends no post_save signal
+            invalidate_reports()
+
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} duplicate reports'))
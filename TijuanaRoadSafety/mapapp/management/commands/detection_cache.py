@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from mapapp.inference_cache import cache_stats, reset_stats
+from mapapp.models import DetectionResult
+
+
+class Command(BaseCommand):
+    help = 'Show how much detection work the detection result cache saves, and maintain it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help='Delete expired and least recently used entries')
+        parser.add_argument('--clear', action='store_true', help='Delete every cached result')
+        parser.add_argument('--reset-stats', action='store_true', help='Start counting hits and misses from zero')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = DetectionResult.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} cached results'))
+        elif options['prune']:
+            self.stdout.write(self.style.SUCCESS(f'Pruned {DetectionResult.prune()} cached results'))
+        if options['reset_stats']:
+            reset_stats()
+
+        stats = cache_stats()
+        self.stdout.write(
+            f"{stats['entries']} cached results; {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate)"
+        )
+        self.stdout.write(
+            f"Saved {stats['saved_calls']} detector calls and about {stats['saved_seconds']:.1f} s "
+            f"at {stats['average_miss_seconds'] * 1000:.0f} ms per call"
+        )
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from mapapp.roboflow import metrics, reset_metrics
+
+
+def histogram_percentile(histogram, fraction):
+    """Upper bound of the latency bucket holding the given fraction of requests"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for bound, count in histogram.items():
+        seen += count
+        if seen >= fraction * total:
+            return bound
+    return 'inf'
+
+
+class Command(BaseCommand):
+    help = 'Show latency and error counters of Roboflow calls from every worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Start counting from zero')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_metrics()
+            self.stdout.write(self.style.SUCCESS('Roboflow metrics reset'))
+            return
+
+        counters = metrics()
+        histogram = counters['latency_histogram']
+        requests = counters['requests']
+        self.stdout.write(
+            f"{requests} requests: {counters['successes']} calls succeeded, {counters['failures']} failed "
+            f"after {counters['retries']} retries"
+        )
+        self.stdout.write(
+            f"Errors: {counters['timeouts']} timeouts, {counters['connection_errors']} connection errors, "
+            f"{counters['http_errors']} HTTP errors"
+        )
+        self.stdout.write(
+            f"Circuit breaker: opened {counters['breaker_opened']} times, "
+            f"{counters['short_circuited']} calls failed fast"
+        )
+        if requests:
+            self.stdout.write(
+                f"Latency: {counters['latency_ms'] / requests:.0f} ms average, "
+                f"p50 <= {histogram_percentile(histogram, 0.5)} ms, p95 <= {histogram_percentile(histogram, 0.95)} ms, "
+                f"p99 <= {histogram_percentile(histogram, 0.99)} ms"
+            )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mapapp.models import PotholeRanking, PotholeReport
+
+
+class Command(BaseCommand):
+    help = 'Check the leaderboard ranking table against the reports and rebuild it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report rows that are missing, stale or orphaned; exit with an error if any are found',
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            report.pk: PotholeRanking.values_for(report)
+            for report in PotholeReport.objects.only(
+                'id', 'submission_count', 'latest_submission_date', 'timestamp', 'status', 'severity'
+            ).iterator()
+        }
+        stored = {
+            row['report_id']: {field: row[field] for field in PotholeRanking.RANKED_FIELDS}
+            for row in PotholeRanking.objects.values('report_id', *PotholeRanking.RANKED_FIELDS).iterator()
+        }
+
+        missing = expected.keys() - stored.keys()
+        orphaned = stored.keys() - expected.keys()
+        stale = [pk for pk in expected.keys() & stored.keys() if expected[pk] != stored[pk]]
+        self.stdout.write(
+            f'{len(expected)} reports: {len(missing)} missing, {len(stale)} stale, '
+            f'{len(orphaned)} orphaned ranking rows'
+        )
+
+        if options['check']:
+            if missing or stale or orphaned:
+                raise CommandError('Ranking table is out of date; run rebuild_rankings to fix it')
+            self.stdout.write(self.style.SUCCESS('Ranking table is consistent'))
+            return
+
+        with transaction.atomic():
+            PotholeRanking.objects.all().delete()
+            PotholeRanking.objects.bulk_create(
+                [PotholeRanking(report_id=pk, **values) for pk, values in expected.items()],
+                batch_size=500,
+            )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(expected)} ranking rows'))
@@ -0,0 +1,153 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mapapp.caching import invalidate_reports
+from mapapp.detection import evaluate_detection
+from mapapp.detectors import get_detector
+from mapapp.models import PotholeReport
+from mapapp.validation import detection_image
+
+FIELDS = ('ai_confidence_score', 'priority_level')
+
+
+def rescore(detector, reports, min_confidence):
+    """
+    Run detection on a batch of reports and set their new confidence and
+    priority; runs in a worker thread without touching the database.
+    Returns (rescored reports, reports that failed, rescored reports now rejected).
+    """
+    images, readable = [], []
+    for report in reports:
+        try:
+            images.append(detection_image(report))
+            readable.append(report)
+        except Exception:
+            pass
+    rescored, rejected = [], 0
+    for report, result in zip(readable, detector.detect_batch(images) if images else []):
+        if 'error' in result:
+            continue
+        accepted, confidence = evaluate_detection(result, min_confidence)
+        report.ai_confidence_score = confidence
+        report.priority_level = report.compute_priority_level()
+        rescored.append(report)
+        rejected += not accepted
+    return rescored, len(reports) - len(rescored), rejected
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-run pothole detection on stored report photos and refresh their AI confidence '
+        'and priority, e.g. after changing the detector model or threshold. Bypasses the '
+        'detection cache. Progress is checkpointed after every round of batches, so an '
+        'interrupted run resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=None, help='Detector backend (default: DETECTOR_BACKEND)')
+        parser.add_argument('--min-confidence', type=float, default=None,
+                            help='Confidence threshold for the rejected count (default: DETECTION_MIN_CONFIDENCE)')
+        parser.add_argument('--status', nargs='+', help='Only reports with these statuses')
+        parser.add_argument('--source', help='Only reports submitted through this source (web or whatsapp)')
+        parser.add_argument('--since', help='Only reports submitted on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, default=2, help='Batches to run in parallel')
+        parser.add_argument('--batch-size', type=int, default=16, help='Photos per detector call')
+        parser.add_argument('--checkpoint', default='reinfer_reports.checkpoint.json',
+                            help='File recording progress, removed when the run completes')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        detector = get_detector(options['backend'])
+        if detector is None:
+            raise CommandError("No detector is configured; pass --backend or set DETECTOR_BACKEND")
+        min_confidence = options['min_confidence']
+        if min_confidence is None:
+            min_confidence = settings.DETECTION_MIN_CONFIDENCE
+
+        reports = PotholeReport.objects.exclude(image='').only(
+            'id', 'image', 'image_large', 'severity', *FIELDS
+        ).order_by('pk')
+        if options['status']:
+            reports = reports.filter(status__in=options['status'])
+        if options['source']:
+            reports = reports.filter(submission_source=options['source'])
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+            reports = reports.filter(timestamp__gte=timezone.make_aware(since))
+
+        # The run a checkpoint belongs to; resuming a different one would skip the wrong reports
+        run = {
+            'model_version': detector.model_version,
+            'min_confidence': min_confidence,
+            'status': sorted(options['status'] or []),
+            'source': options['source'],
+            'since': options['since'],
+        }
+        path = options['checkpoint']
+        progress = {'last_pk': 0, 'processed': 0, 'updated': 0, 'failed': 0, 'rejected': 0, 'seconds': 0.0}
+        if os.path.exists(path) and not options['restart']:
+            with open(path) as f:
+                checkpoint = json.load(f)
+            if checkpoint['run'] != run:
+                raise CommandError(f"{path} belongs to a run with other options; pass --restart to start over")
+            progress = checkpoint['progress']
+            self.stdout.write(f"Resuming after report {progress['last_pk']} ({progress['processed']} already processed)")
+
+        total = progress['processed'] + reports.filter(pk__gt=progress['last_pk']).count()
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Re-scoring {total} reports with {detector.model_version}")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                started = time.perf_counter()
+                # One round: a batch for each worker
+                loaded = list(reports.filter(pk__gt=progress['last_pk'])[:batch_size * workers])
+                if not loaded:
+                    break
+                batches = [loaded[start:start + batch_size] for start in range(0, len(loaded), batch_size)]
+                outcomes = list(executor.map(lambda batch: rescore(detector, batch, min_confidence), batches))
+
+                rescored = [report for batch_rescored, _, _ in outcomes for report in batch_rescored]
+                # Only the rescored columns are written, so report timestamps stay as they were
+                PotholeReport.objects.bulk_update(rescored, list(FIELDS))
+                progress['last_pk'] = loaded[-1].pk
+                progress['processed'] += len(loaded)
+                progress['updated'] += len(rescored)
+                progress['failed'] += sum(failed for _, failed, _ in outcomes)
+                progress['rejected'] += sum(rejected for _, _, rejected in outcomes)
+                progress['seconds'] += time.perf_counter() - started
+                self._save_checkpoint(path, run, progress)
+                self.stdout.write(
+                    f"{progress['processed']}/{total} reports, "
+                    f"{progress['processed'] / progress['seconds']:.1f} reports/s"
+                )
+
+        if os.path.exists(path):
+            os.remove(path)
+        # bulk_update sends no post_save signal, so invalidate cached pages here
+        invalidate_reports()
+
+        rate = progress['processed'] / progress['seconds'] if progress['seconds'] else 0.0
+        style = self.style.SUCCESS if not progress['failed'] else self.style.WARNING
+        self.stdout.write(style(
+            f"Re-scored {progress['updated']} reports in {progress['seconds']:.1f}s ({rate:.1f} reports/s), "
+            f"{progress['failed']} failed, {progress['rejected']} now below the detection threshold"
+        ))
+
+    def _save_checkpoint(self, path, run, progress):
+        # Written to a temporary file and renamed, so an interruption never leaves half a checkpoint
+        partial = f'{path}.tmp'
+        with open(partial, 'w') as f:
+            json.dump({'run': run, 'progress': progress}, f)
+        os.replace(partial, path)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from mapapp.validation import stale_validations, validate_report
+
+
+class Command(BaseCommand):
+    help = (
+        'Validate web reports still awaiting validation, whose background job was lost to a '
+        'restart or crashed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=300,
+                            help='Only reports awaiting validation for at least this many seconds')
+
+    def handle(self, *args, **options):
+        validated = failed = 0
+        for report_id in stale_validations(options['older_than']).values_list('pk', flat=True):
+            try:
+                report = validate_report(report_id)
+            except Exception as e:
+                self.stderr.write(f'Report {report_id} could not be validated: {e}')
+                report = None
+            if report is None:
+                failed += 1
+            else:
+                validated += 1
+                self.stdout.write(f'Report {report_id}: {report.status}')
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f'Validated {validated} stale reports, {failed} still awaiting validation'))
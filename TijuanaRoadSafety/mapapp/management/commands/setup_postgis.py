@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from mapapp import postgis
+
+
+class Command(BaseCommand):
+    help = 'Create or repair the PostGIS location column, trigger and GiST index for pothole reports'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.ERROR('PostGIS requires a PostgreSQL database'))
+            return
+
+        if not postgis.is_available():
+            self.stdout.write(self.style.ERROR('The postgis extension is not available on this server'))
+            return
+
+        postgis.install()
+        self.stdout.write(self.style.SUCCESS('PostGIS location column and index are ready'))
+
+        if not settings.USE_POSTGIS:
+            self.stdout.write(
+                self.style.WARNING('USE_POSTGIS is not set, nearby queries will keep using the geohash index')
+            )
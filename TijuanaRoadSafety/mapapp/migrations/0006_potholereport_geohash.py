@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-17 20:44
+
+from django.db import migrations, models
+
+from mapapp.geo import geohash_encode
+
+
+def backfill_geohash(apps, schema_editor):
+    PotholeReport = apps.get_model('mapapp', 'PotholeReport')
+    reports = list(PotholeReport.objects.only('id', 'latitude', 'longitude'))
+    for report in reports:
+        report.geohash = geohash_encode(report.latitude, report.longitude)
+    PotholeReport.objects.bulk_update(reports, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0005_potholereport_latest_submission_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='potholereport',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Geohash of the report location, used for nearby lookups', max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Optional PostGIS location column, see mapapp/postgis.py
+
+from django.db import migrations
+
+from mapapp import postgis
+
+
+def install_postgis(apps, schema_editor):
+    if postgis.is_enabled(schema_editor.connection):
+        postgis.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0006_potholereport_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_postgis, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0007_postgis_location'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='potholereport',
+            name='last_updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='Last time this report was updated'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1 on 2026-10-17 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_rankings(apps, schema_editor):
+    PotholeReport = apps.get_model('mapapp', 'PotholeReport')
+    PotholeRanking = apps.get_model('mapapp', 'PotholeRanking')
+    PotholeRanking.objects.bulk_create(
+        [
+            PotholeRanking(
+                report_id=report_id,
+                submission_count=submission_count,
+                latest_submission_date=latest_submission_date or timestamp,
+                status=status,
+                severity=severity,
+            )
+            for report_id, submission_count, latest_submission_date, timestamp, status, severity
+            in PotholeReport.objects.values_list(
+                'id', 'submission_count', 'latest_submission_date', 'timestamp', 'status', 'severity'
+            ).iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0009_potholereport_last_updated_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PotholeRanking',
+            fields=[
+                ('report', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='mapapp.potholereport')),
+                ('submission_count', models.IntegerField()),
+                ('latest_submission_date', models.DateTimeField()),
+                ('status', models.CharField(max_length=20)),
+                ('severity', models.IntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-submission_count', '-latest_submission_date'], name='ranking_order_idx'), models.Index(fields=['status', '-submission_count', '-latest_submission_date'], name='ranking_status_idx')],
+            },
+        ),
+        migrations.RunPython(populate_rankings, migrations.RunPython.noop),
+    ]
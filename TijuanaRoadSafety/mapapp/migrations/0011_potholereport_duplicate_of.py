@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-17 21:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0010_pothole_ranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='potholereport',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Open pothole this report was counted towards after validation', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='mapapp.potholereport'),
+        ),
+    ]
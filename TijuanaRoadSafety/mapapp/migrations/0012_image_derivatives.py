@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-17 21:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0011_potholereport_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='potholereport',
+            name='image_large',
+            field=models.ImageField(blank=True, editable=False, upload_to='pothole_images/derivatives/'),
+        ),
+        migrations.AddField(
+            model_name='potholereport',
+            name='image_medium',
+            field=models.ImageField(blank=True, editable=False, upload_to='pothole_images/derivatives/'),
+        ),
+        migrations.AddField(
+            model_name='potholereport',
+            name='image_small',
+            field=models.ImageField(blank=True, editable=False, upload_to='pothole_images/derivatives/'),
+        ),
+    ]
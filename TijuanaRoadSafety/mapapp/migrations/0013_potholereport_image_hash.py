@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0012_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='potholereport',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+    ]
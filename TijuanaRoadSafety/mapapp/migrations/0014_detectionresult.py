@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-17 21:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0013_potholereport_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+                ('model_version', models.CharField(max_length=100)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('digest', 'model_version'), name='detection_result_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-17 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0014_detectionresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhatsAppConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=20, unique=True)),
+                ('state', models.JSONField(default=dict)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 21:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0015_whatsappconversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='potholereport',
+            name='image_sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-17 21:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapapp', '0016_potholereport_image_sha256'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='potholereport',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Open pothole this report was counted towards, or will be once its photo passes validation', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='mapapp.potholereport'),
+        ),
+        migrations.AlterField(
+            model_name='potholereport',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending Review'), ('verified', 'Verified'), ('in_progress', 'In Progress'), ('resolved', 'Resolved'), ('duplicate', 'Duplicate'), ('invalid', 'Invalid'), ('validating', 'Awaiting Validation')], default='pending', help_text='Current status of the pothole report', max_length=20),
+        ),
+    ]
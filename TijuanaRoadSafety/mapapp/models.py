@@ -1,5 +1,31 @@
-from django.db import models
-import math
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+import numpy as np
+
+from . import geo, postgis
+from .caching import invalidate_reports
+
+
+class GeohashQuerySet(models.QuerySet):
+    def near(self, latitude, longitude, radius_meters):
+        """
+        Narrow to rows in the geohash cell around the point and its eight
+        neighbours. Callers still need an exact distance check on the result.
+        """
+        precision = geo.precision_for_radius(latitude, radius_meters)
+        cell_filter = Q()
+        for cell in geo.geohash_neighbours(latitude, longitude, precision):
+            lower, upper = geo.geohash_prefix_range(cell)
+            cell_range = Q(geohash__gte=lower)
+            if upper:
+                cell_range &= Q(geohash__lt=upper)
+            cell_filter |= cell_range
+        return self.filter(cell_filter)
+
 
 class PotholeReport(models.Model):
     # Contact Information
@@ -20,7 +46,23 @@ class PotholeReport(models.Model):
     severity = models.IntegerField(choices=[(i, str(i)) for i in range(1, 6)])
     latitude = models.FloatField()
     longitude = models.FloatField()
+    geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        help_text='Geohash of the report location, used for nearby lookups'
+    )
     image = models.ImageField(upload_to='pothole_images/')
+    # Resized copies of image (see images.py), empty until generated
+    image_large = models.ImageField(upload_to='pothole_images/derivatives/', blank=True, editable=False)
+    image_medium = models.ImageField(upload_to='pothole_images/derivatives/', blank=True, editable=False)
+    image_small = models.ImageField(upload_to='pothole_images/derivatives/', blank=True, editable=False)
+    # Perceptual hash of image as 16 hex digits (see photo_index.py)
+    image_hash = models.CharField(max_length=16, blank=True, editable=False)
+    # SHA-256 of the uploaded file; reports with byte-identical photos share the stored files
+    image_sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
     approximate_address = models.CharField(max_length=255, blank=True, null=True)
     additional_notes = models.TextField(
         blank=True,
@@ -32,6 +74,7 @@ class PotholeReport(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(
         auto_now=True,
+        db_index=True,
         help_text='Last time this report was updated'
     )
     latest_submission_date = models.DateTimeField(
@@ -75,6 +118,7 @@ class PotholeReport(models.Model):
             ('resolved', 'Resolved'),
             ('duplicate', 'Duplicate'),
             ('invalid', 'Invalid'),
+            ('validating', 'Awaiting Validation'),
         ],
         default='pending',
         help_text='Current status of the pothole report'
@@ -91,27 +135,102 @@ class PotholeReport(models.Model):
         help_text='Priority level based on severity and location'
     )
     
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='duplicates',
+        help_text='Open pothole this report was counted towards, or will be once its photo passes validation'
+    )
+    
+    objects = GeohashQuerySet.as_manager()
+    
+    def compute_priority_level(self):
+        """Priority level based on severity and AI confidence"""
+        # Upgrade to urgent if AI confidence is very high and severity is high
+        if self.ai_confidence_score and self.ai_confidence_score >= 0.9 and self.severity >= 4:
+            return 'urgent'
+        if self.severity >= 4:
+            return 'high'
+        if self.severity >= 3:
+            return 'medium'
+        return 'low'
+    
     def save(self, *args, **kwargs):
         """Override save to set priority level based on severity and AI confidence"""
         from django.utils import timezone
         
-        # Auto-set priority based on severity
-        if self.severity >= 4:
-            self.priority_level = 'high'
-        elif self.severity >= 3:
-            self.priority_level = 'medium'
-        else:
-            self.priority_level = 'low'
-            
-        # Upgrade to urgent if AI confidence is very high and severity is high
-        if self.ai_confidence_score and self.ai_confidence_score >= 0.9 and self.severity >= 4:
-            self.priority_level = 'urgent'
+        self.priority_level = self.compute_priority_level()
         
         # Set latest_submission_date if it's not set (for existing records)
         if not self.latest_submission_date:
             self.latest_submission_date = timezone.now()
-            
+        
+        # Keep the geohash in sync with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.geohash_encode(self.latitude, self.longitude)
+        
+        self.store_photo()
         super().save(*args, **kwargs)
+        
+        # Keep the leaderboard ranking in step with the report
+        PotholeRanking.sync(self)
+    
+    def store_photo(self):
+        """
+        Hash, resize and store a freshly uploaded photo without saving the
+        report, reusing the decode from form validation when there was one.
+        save() does this too; submit() calls it before taking its lock.
+        """
+        if self.image and not self.image._committed:
+            self._store_new_photo()
+            # Unless the files of an identical photo were reused
+            if not self.image._committed:
+                self.image.save(self.image.name, self.image.file, save=False)
+    
+    def _store_new_photo(self):
+        """
+        Hash the uploaded photo and generate its derivatives. A byte-identical
+        photo that was stored before points at the existing files instead of
+        uploading copies; a photo that only looks alike (see photo_index.py)
+        is always stored as uploaded.
+        """
+        import hashlib
+        
+        from .images import DERIVATIVE_SIZES, attach_derivatives, decode_or_none
+        
+        decoded = decode_or_none(self.image.file, self.image.name)
+        if decoded is None:
+            return
+        self.image_hash = decoded.image_hash()
+        # ImageUploadHandler hashed web uploads while they streamed in
+        self.image_sha256 = getattr(self.image.file, 'sha256', None) or hashlib.sha256(decoded.data).hexdigest()
+        
+        previous = (
+            PotholeReport.objects.filter(image_sha256=self.image_sha256)
+            .exclude(image_small='')
+            .only('image', *DERIVATIVE_SIZES)
+            .first()
+        )
+        if previous is not None:
+            for field in ('image', *DERIVATIVE_SIZES):
+                setattr(self, field, getattr(previous, field).name)
+            return
+        attach_derivatives(self, decoded)
+    
+    def detection_verdict(self):
+        """
+        (accepted, confidence) from this report's earlier validation, or None
+        if the detector never saw its photo. The stored confidence is held
+        against the current DETECTION_MIN_CONFIDENCE, as reinfer_reports
+        rescores photos without changing their status.
+        """
+        if self.status == 'invalid':
+            return False, self.ai_confidence_score
+        if self.ai_confidence_score is not None:
+            return self.ai_confidence_score >= settings.DETECTION_MIN_CONFIDENCE, self.ai_confidence_score
+        return None
     
     def __str__(self):
         return f"Pothole Report #{self.id} - {self.get_status_display()} ({self.get_priority_level_display()})"
@@ -139,40 +258,395 @@ class PotholeReport(models.Model):
     def increment_submission_count(self):
         """Increment submission count and update latest submission date"""
         from django.utils import timezone
-        self.submission_count += 1
-        self.latest_submission_date = timezone.now()
-        self.save()
+        now = timezone.now()
+        # Update in SQL so concurrent confirmations are never lost
+        PotholeReport.objects.filter(pk=self.pk).update(
+            submission_count=F('submission_count') + 1,
+            latest_submission_date=now,
+            last_updated=now,
+        )
+        self.refresh_from_db(fields=['submission_count', 'latest_submission_date', 'last_updated'])
+        PotholeRanking.objects.filter(report_id=self.pk).update(
+            submission_count=F('submission_count') + 1,
+            latest_submission_date=now,
+        )
+        # update() sends no post_save signal, so invalidate cached pages here
+        invalidate_reports()
+    
+    def image_variant_url(self, field):
+        """URL of a derivative of the photo, falling back to the original"""
+        image = getattr(self, field) or self.image
+        return image.url if image else None
+    
+    @property
+    def small_image_url(self):
+        return self.image_variant_url('image_small')
+    
+    @property
+    def medium_image_url(self):
+        return self.image_variant_url('image_medium')
+    
+    @property
+    def large_image_url(self):
+        return self.image_variant_url('image_large')
+    
+    @classmethod
+    def bulk_set_status(cls, queryset, status):
+        """Change the status of every report in queryset; returns how many changed"""
+        from django.utils import timezone
+        ids = list(queryset.values_list('id', flat=True))
+        cls.objects.filter(pk__in=ids).update(status=status, last_updated=timezone.now())
+        PotholeRanking.objects.filter(report_id__in=ids).update(status=status)
+        invalidate_reports()
+        return len(ids)
+    
+    # Statuses of potholes still on the street, and of those that new
+    # submissions can no longer be merged into. Reports awaiting validation
+    # are neither: nothing public shows them until their photo is checked.
+    OPEN_STATUSES = ('pending', 'verified', 'in_progress')
+    CLOSED_STATUSES = ('resolved', 'duplicate', 'invalid')
+    PUBLIC_STATUSES = OPEN_STATUSES + CLOSED_STATUSES
+    # Open potholes confirmed by review or detection. Submissions are only
+    # merged into these, or into open ones whose photo passed detection (see
+    # accepts_merges), so an unchecked photo never absorbs reports of a real
+    # pothole next to it.
+    MERGE_STATUSES = ('verified', 'in_progress')
+    
+    def accepts_merges(self):
+        """Whether nearby submissions are merged into this report without the reporter picking it"""
+        if self.status in self.MERGE_STATUSES:
+            return True
+        # Reports saved as pending before web uploads were marked verified
+        return (self.status in self.OPEN_STATUSES and self.ai_confidence_score is not None
+                and self.ai_confidence_score >= settings.DETECTION_MIN_CONFIDENCE)
+    
+    @classmethod
+    def merge_targets(cls):
+        """Q filter matching the reports accepts_merges() is true for"""
+        return Q(status__in=cls.MERGE_STATUSES) | Q(
+            status__in=cls.OPEN_STATUSES, ai_confidence_score__gte=settings.DETECTION_MIN_CONFIDENCE
+        )
+    
+    @classmethod
+    def submit(cls, report, radius_meters=None, merge_into=None, merge=True):
+        """
+        Save a new, unsaved report, merging it into an existing pothole within
+        radius_meters: the one the reporter picked (merge_into, the id of an
+        open pothole), or else the nearest one accepting merges. With
+        merge=False the reporter said it is a new pothole and nothing is merged.
+        
+        A merged report is still saved, as a duplicate of the pothole it was
+        counted towards, so its photo and severity stay on record. A report
+        awaiting validation is only marked as duplicate_of the pothole, and
+        apply_validation counts the submission once the photo passes.
+        
+        The check and the write happen in one transaction holding a lock on
+        the surrounding area, so concurrent submissions for the same spot
+        cannot both create a new pothole. The photo is stored before the lock
+        is taken. Returns (pothole, merged).
+        """
+        from .locking import lock_area
+        
+        if radius_meters is None:
+            radius_meters = settings.POTHOLE_MERGE_RADIUS_METERS
+        
+        report.store_photo()
+        with transaction.atomic():
+            lock_area(report.latitude, report.longitude, radius_meters)
+            existing = None
+            if merge:
+                existing = cls.chosen_target(report.latitude, report.longitude, radius_meters, merge_into)
+                if existing is None:
+                    existing = cls.merge_target(report.latitude, report.longitude, radius_meters)
+            report.duplicate_of = existing
+            if existing is None or report.status == 'validating':
+                report.save()
+                return report, False
+            
+            report.status = 'duplicate'
+            report.save()
+            existing.increment_submission_count()
+            return existing, True
+    
+    @classmethod
+    def merge_target(cls, latitude, longitude, radius_meters, exclude=None):
+        """The nearest pothole within radius_meters that submissions there merge into, or None"""
+        for item in cls.find_nearby_potholes(latitude, longitude, radius_meters):
+            existing = item['pothole']
+            if existing.accepts_merges() and existing.pk != exclude:
+                return existing
+        return None
+    
+    @classmethod
+    def chosen_target(cls, latitude, longitude, radius_meters, pk):
+        """The open pothole with id pk if it lies within radius_meters, as a reporter picked it, or None"""
+        if pk is None:
+            return None
+        for item in cls.find_nearby_potholes(latitude, longitude, radius_meters):
+            existing = item['pothole']
+            if existing.pk == pk and existing.status in cls.OPEN_STATUSES:
+                return existing
+        return None
     
     @classmethod
-    def find_nearby_potholes(cls, latitude, longitude, radius_meters=50):
-        """Find potholes within specified radius using Haversine formula"""
-        # Convert radius from meters to degrees (approximate)
-        radius_degrees = radius_meters / 111000  # 1 degree ≈ 111km
+    def apply_validation(cls, report, accepted, confidence=None, radius_meters=None):
+        """
+        Record the detector's verdict on a report awaiting validation.
+        Rejected reports become invalid. Accepted ones become verified, unless
+        they were marked as duplicate_of a pothole still open, or a pothole
+        accepting merges now lies within radius_meters: then the report is
+        marked as its duplicate and counted as one more submission of it, as
+        submit() would have done. With accepted=None, when the detector could
+        not be reached, the report is handled like an accepted one but left
+        pending for manual review. A report validated meanwhile, e.g. by a
+        requeued job, is left alone.
+        """
+        from .locking import lock_area
+        
+        if radius_meters is None:
+            radius_meters = settings.POTHOLE_MERGE_RADIUS_METERS
+        
+        with transaction.atomic():
+            lock_area(report.latitude, report.longitude, radius_meters)
+            if not cls.objects.filter(pk=report.pk, status='validating').exists():
+                return report
+            
+            report.ai_confidence_score = confidence
+            if accepted is False:
+                report.status = 'invalid'
+                report.duplicate_of = None
+                report.save()
+                return report
+            
+            # The pothole picked at submission, if still open, or the nearest one accepting merges now
+            existing = None
+            if report.duplicate_of_id is not None:
+                existing = cls.objects.filter(pk=report.duplicate_of_id, status__in=cls.OPEN_STATUSES).first()
+            if existing is None:
+                existing = cls.merge_target(report.latitude, report.longitude, radius_meters, exclude=report.pk)
+            if existing is not None:
+                existing.increment_submission_count()
+                report.status = 'duplicate'
+                report.duplicate_of = existing
+                report.save()
+                return report
+            
+            report.status = 'verified' if accepted else 'pending'
+            report.duplicate_of = None
+            report.save()
+            return report
+    
+    # Columns needed to show a nearby pothole to the reporter
+    NEARBY_FIELDS = (
+        'id', 'latitude', 'longitude', 'severity', 'submission_count',
+        'image', 'image_small', 'approximate_address', 'status', 'ai_confidence_score',
+    )
+    
+    @classmethod
+    def find_nearby_potholes(cls, latitude, longitude, radius_meters=50, limit=None):
+        """
+        Find potholes within specified radius, nearest first.
+        
+        Uses the PostGIS index when USE_POSTGIS is enabled, otherwise the
+        geohash cells around the point plus an exact Haversine check.
+        """
+        if postgis.is_enabled():
+            matches = postgis.find_nearby(latitude, longitude, radius_meters, limit)
+            potholes = cls.objects.only(*cls.NEARBY_FIELDS).in_bulk([pk for pk, _ in matches])
+            return [
+                {'pothole': potholes[pk], 'distance': distance}
+                for pk, distance in matches if pk in potholes
+            ]
+        
+        # Only look at the geohash cell containing the point and its neighbours
+        candidates = list(cls.objects.near(latitude, longitude, radius_meters).only(*cls.NEARBY_FIELDS))
+        distances = geo.distances_from_point(
+            latitude, longitude,
+            [pothole.latitude for pothole in candidates],
+            [pothole.longitude for pothole in candidates],
+        )
         
         nearby_potholes = []
-        for pothole in cls.objects.all():
-            distance = cls.calculate_distance(latitude, longitude, pothole.latitude, pothole.longitude)
+        for pothole, distance in zip(candidates, distances):
             if distance <= radius_meters:
                 nearby_potholes.append({
                     'pothole': pothole,
-                    'distance': distance
+                    'distance': float(distance)
                 })
         
-        return sorted(nearby_potholes, key=lambda x: x['distance'])
+        nearby_potholes.sort(key=lambda x: x['distance'])
+        return nearby_potholes[:limit] if limit is not None else nearby_potholes
     
     @staticmethod
     def calculate_distance(lat1, lon1, lat2, lon2):
         """Calculate distance between two points using Haversine formula"""
-        R = 6371000  # Earth's radius in meters
-        
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lon = math.radians(lon2 - lon1)
+        return geo.point_distance(lat1, lon1, lat2, lon2)
+    
+    @classmethod
+    def calculate_distances(cls, latitude, longitude, queryset=None, method='haversine'):
+        """
+        Distances in meters from a point to every report in queryset (all reports
+        by default), computed in one vectorized pass.
         
-        a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) +
-             math.cos(lat1_rad) * math.cos(lat2_rad) *
-             math.sin(delta_lon/2) * math.sin(delta_lon/2))
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+        Returns a (ids, distances) pair of NumPy arrays.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+        rows = np.array(list(queryset.values_list('id', 'latitude', 'longitude')), dtype=np.float64).reshape(-1, 3)
+        distances = geo.distances_from_point(latitude, longitude, rows[:, 1], rows[:, 2], method)
+        return rows[:, 0].astype(np.int64), distances
+
+
+class PotholeRanking(models.Model):
+    """
+    Denormalized copy of the columns the leaderboard ranks on, one row per
+    report. PotholeReport.save(), increment_submission_count() and the admin
+    status actions keep it in step; `python manage.py rebuild_rankings`
+    checks or rebuilds it from scratch.
+
+    The indexes store rows in ranking order, so a top-K query walks the index
+    from the top and stops after K matching rows instead of sorting the
+    whole report table.
+    """
+    report = models.OneToOneField(
+        PotholeReport,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking'
+    )
+    submission_count = models.IntegerField()
+    latest_submission_date = models.DateTimeField()
+    status = models.CharField(max_length=20)
+    severity = models.IntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-submission_count', '-latest_submission_date'], name='ranking_order_idx'),
+            models.Index(fields=['status', '-submission_count', '-latest_submission_date'], name='ranking_status_idx'),
+        ]
+    
+    RANKED_FIELDS = ('submission_count', 'latest_submission_date', 'status', 'severity')
+    
+    @classmethod
+    def values_for(cls, report):
+        return {
+            'submission_count': report.submission_count,
+            'latest_submission_date': report.latest_submission_date or report.timestamp,
+            'status': report.status,
+            'severity': report.severity,
+        }
+    
+    @classmethod
+    def sync(cls, report):
+        """Create or update the ranking row of a saved report"""
+        cls.objects.update_or_create(report_id=report.pk, defaults=cls.values_for(report))
+    
+    @classmethod
+    def top(cls, k=10, statuses=None, min_severity=None, since=None):
+        """
+        The k highest ranked reports: most submissions first, then the most
+        recently confirmed. Optionally only reports with one of statuses, with
+        at least min_severity, or confirmed at or after since.
+        """
+        rankings = cls.objects.select_related('report')
+        if min_severity is not None:
+            rankings = rankings.filter(severity__gte=min_severity)
+        if since is not None:
+            rankings = rankings.filter(latest_submission_date__gte=since)
         
-        return R * c
\ No newline at end of file
+        # An IN filter would make the database sort every matching row; one
+        # query per status reads the first k entries of the status index instead
+        groups = [rankings] if statuses is None else [rankings.filter(status=status) for status in statuses]
+        candidates = []
+        for group in groups:
+            candidates.extend(group.order_by('-submission_count', '-latest_submission_date')[:k])
+        candidates.sort(key=lambda ranking: (ranking.submission_count, ranking.latest_submission_date), reverse=True)
+        return [ranking.report for ranking in candidates[:k]]
+    
+    def __str__(self):
+        return f"Ranking of report #{self.report_id} ({self.submission_count} submissions)"
+
+
+class DetectionResult(models.Model):
+    """
+    Detector output cached by image content: one row per SHA-256 of the JPEG
+    sent to the detector and model version, shared by every worker (see
+    inference_cache.py). Rows expire after DETECTION_CACHE_TTL_SECONDS and
+    the least recently used ones are evicted beyond DETECTION_CACHE_MAX_ENTRIES,
+    by a sampled fraction of stores (DETECTION_CACHE_PRUNE_RATE) or by
+    `python manage.py detection_cache --prune`.
+    """
+    digest = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=100)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['digest', 'model_version'], name='detection_result_key'),
+        ]
+    
+    @classmethod
+    def lookup(cls, digest, model_version):
+        """The cached result for an image, or None if absent or expired; marks the row as used"""
+        from django.utils import timezone
+        now = timezone.now()
+        fresh_after = now - timedelta(seconds=settings.DETECTION_CACHE_TTL_SECONDS)
+        entry = cls.objects.filter(
+            digest=digest, model_version=model_version, created_at__gte=fresh_after
+        ).only('pk', 'result').first()
+        if entry is None:
+            return None
+        cls.objects.filter(pk=entry.pk).update(last_used_at=now, hits=F('hits') + 1)
+        return entry.result
+    
+    @classmethod
+    def store(cls, digest, model_version, result):
+        """
+        Cache a result. One store in 1/DETECTION_CACHE_PRUNE_RATE also prunes
+        the table, which keeps the extra queries off most detections; lookups
+        skip expired rows in the meantime.
+        """
+        from django.utils import timezone
+        now = timezone.now()
+        cls.objects.update_or_create(
+            digest=digest, model_version=model_version,
+            defaults={'result': result, 'last_used_at': now, 'created_at': now, 'hits': 0},
+        )
+        if random.random() < settings.DETECTION_CACHE_PRUNE_RATE:
+            cls.prune(now)
+    
+    @classmethod
+    def prune(cls, now=None):
+        """Delete expired and least recently used rows; returns how many were deleted"""
+        from django.utils import timezone
+        now = now or timezone.now()
+        deleted, _ = cls.objects.filter(
+            created_at__lt=now - timedelta(seconds=settings.DETECTION_CACHE_TTL_SECONDS)
+        ).delete()
+        max_entries = settings.DETECTION_CACHE_MAX_ENTRIES
+        if cls.objects.count() > max_entries:
+            evicted = list(cls.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:])
+            deleted += cls.objects.filter(pk__in=evicted).delete()[0]
+        return deleted
+    
+    def __str__(self):
+        return f"Detection of {self.digest[:12]} by {self.model_version}"
+
+
+class WhatsAppConversation(models.Model):
+    """
+    The state of a WhatsApp conversation with one sender, for the database
+    conversation store (see conversations.py). version grows with every
+    change, so concurrent updates can be detected; rows past expires_at are
+    treated as absent and deleted by cleanup.
+    """
+    phone_number = models.CharField(max_length=20, unique=True)
+    state = models.JSONField(default=dict)
+    version = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"WhatsApp conversation with {self.phone_number} (v{self.version})"
@@ -0,0 +1,183 @@
+"""
+Compact binary wire format for map points.
+
+Layout (little endian):
+
+    magic     3 bytes  b'PTS'
+    version   1 byte   1
+    count     uint32   number of points
+    scale     uint32   fixed-point units per degree (COORDINATE_SCALE)
+    ids       count varints, zigzag deltas of the feature ids
+    lats      count varints, zigzag deltas of the quantized latitudes
+    lons      count varints, zigzag deltas of the quantized longitudes
+    counts    count varints, submission count (point count for clusters)
+    attrs     count bytes: severity in bits 0-2, status code in bits 3-5,
+              bit 6 set for clusters (whose severity is the maximum one);
+              status code 7 means the status was not sent
+
+Points are sorted along a Z-order (Morton) curve of their quantized
+coordinates, so neighbours on the map are neighbours in the stream and the
+coordinate deltas mostly fit in one or two bytes. The matching JavaScript
+decoder is in templates/map_points_decoder.html.
+"""
+import struct
+
+import numpy as np
+
+from .snapshot import STATUS_CODES
+
+MAGIC = b'PTS'
+VERSION = 1
+HEADER = struct.Struct('<3sBII')
+
+# 1e-5 degrees is about 1.1 m, well below the size of a marker
+COORDINATE_SCALE = 100_000
+
+CONTENT_TYPE = 'application/x-pothole-points'
+
+CLUSTER_FLAG = 0x40
+
+# Status code written for clusters and features that carry no status
+UNKNOWN_STATUS = 7
+
+
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values):
+    values = values.astype(np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+
+def _varints(values):
+    """LEB128 encoding of an array of unsigned integers"""
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        selected = lengths > k
+        chunk = (values[selected] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (lengths[selected] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[selected] + k] = (chunk | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def _read_varints(buffer, offset, count):
+    """Decode count varints starting at offset; returns (values, next offset)"""
+    data = np.frombuffer(buffer, dtype=np.uint8, offset=offset)
+    ends = np.flatnonzero(data < 0x80)[:count]
+    if len(ends) < count:
+        raise ValueError('Truncated point payload')
+    if count == 0:
+        return np.zeros(0, dtype=np.uint64), offset
+
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    values = np.zeros(count, dtype=np.uint64)
+    for k in range(int(lengths.max())):
+        selected = lengths > k
+        chunk = data[starts[selected] + k].astype(np.uint64) & np.uint64(0x7F)
+        values[selected] |= chunk << np.uint64(7 * k)
+    return values, offset + int(ends[-1]) + 1
+
+
+def _spread_bits(values):
+    """Interleave zeros between the low 32 bits of each value"""
+    values = values & np.uint64(0xFFFFFFFF)
+    for shift, mask in (
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def encode(ids, latitudes, longitudes, counts, severities, statuses=None, clusters=None):
+    """Pack parallel point arrays into the binary format"""
+    n = len(ids)
+    lat_q = np.rint(np.asarray(latitudes, dtype=np.float64) * COORDINATE_SCALE).astype(np.int64)
+    lon_q = np.rint(np.asarray(longitudes, dtype=np.float64) * COORDINATE_SCALE).astype(np.int64)
+
+    morton = (
+        _spread_bits((lat_q + 90 * COORDINATE_SCALE).astype(np.uint64)) << np.uint64(1)
+        | _spread_bits((lon_q + 180 * COORDINATE_SCALE).astype(np.uint64))
+    )
+    order = np.argsort(morton, kind='stable')
+
+    attrs = np.asarray(severities, dtype=np.uint8)[order] & 0x07
+    if statuses is None:
+        attrs |= UNKNOWN_STATUS << 3
+    else:
+        attrs |= (np.asarray(statuses, dtype=np.uint8)[order] & 0x07) << 3
+    if clusters is not None:
+        attrs |= np.where(np.asarray(clusters, dtype=np.bool_)[order], CLUSTER_FLAG, 0).astype(np.uint8)
+
+    def deltas(values):
+        return _varints(_zigzag(np.diff(values[order], prepend=0)))
+
+    return b''.join((
+        HEADER.pack(MAGIC, VERSION, n, COORDINATE_SCALE),
+        deltas(np.asarray(ids, dtype=np.int64)),
+        deltas(lat_q),
+        deltas(lon_q),
+        _varints(np.asarray(counts, dtype=np.uint64)[order]),
+        attrs.tobytes(),
+    ))
+
+
+def decode(buffer):
+    """Unpack a payload into a dict of column arrays (the inverse of encode)"""
+    magic, version, n, scale = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a version %d point payload' % VERSION)
+
+    offset = HEADER.size
+    columns = {}
+    for name in ('id', 'latitude', 'longitude'):
+        values, offset = _read_varints(buffer, offset, n)
+        columns[name] = np.cumsum(_unzigzag(values))
+    columns['latitude'] = columns['latitude'] / scale
+    columns['longitude'] = columns['longitude'] / scale
+    counts, offset = _read_varints(buffer, offset, n)
+    columns['count'] = counts.astype(np.int64)
+
+    attrs = np.frombuffer(buffer, dtype=np.uint8, count=n, offset=offset)
+    columns['severity'] = attrs & 0x07
+    columns['status'] = (attrs >> 3) & 0x07
+    columns['cluster'] = (attrs & CLUSTER_FLAG) != 0
+    return columns
+
+
+def encode_features(features):
+    """Pack GeoJSON features as produced by the map endpoints"""
+    ids, latitudes, longitudes, counts, severities, statuses, clusters = ([] for _ in range(7))
+    for feature in features:
+        longitude, latitude = feature['geometry']['coordinates']
+        properties = feature['properties']
+        cluster = bool(properties.get('cluster'))
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+        clusters.append(cluster)
+        if cluster:
+            ids.append(0)
+            counts.append(properties['point_count'])
+            severities.append(properties['max_severity'])
+            statuses.append(UNKNOWN_STATUS)
+        else:
+            ids.append(properties['id'])
+            counts.append(properties['submission_count'])
+            severities.append(properties['severity'])
+            statuses.append(STATUS_CODES.get(properties.get('status'), UNKNOWN_STATUS))
+    return encode(ids, latitudes, longitudes, counts, severities, statuses, clusters)
@@ -0,0 +1,144 @@
+"""
+Lookup of report photos by perceptual hash.
+
+Every stored photo gets a 64-bit difference hash (PotholeReport.image_hash,
+see images.difference_hash). Re-uploads of the same photo, even after
+WhatsApp recompression or resizing, land within a few bits of each other.
+The hashes are kept in a per-worker BK-tree, a metric tree over Hamming
+distance, so finding every photo within PHOTO_MATCH_MAX_DISTANCE bits skips
+most of the index instead of comparing against each report.
+
+The tree picks up new reports incrementally by primary key on each lookup.
+The build_photo_index command bumps PHOTO_INDEX_EPOCH_KEY in the shared
+cache after hashing older reports, which makes every worker rebuild its tree.
+Matches are always re-read from the database, so a deleted report or a
+changed photo is never returned.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import PotholeReport
+
+PHOTO_INDEX_EPOCH_KEY = 'mapapp:photo-index-epoch'
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree of integer hashes under Hamming distance, each hash holding a list of ids"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            node_value, items, children = node
+            distance = hamming(value, node_value)
+            if distance == 0:
+                items.append(item)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """(distance, item) for every item whose hash is within max_distance of value, closest first"""
+        matches = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in items)
+            # By the triangle inequality only children at distance d from this
+            # node with |d - distance| <= max_distance can hold matches
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: (match[0], -match[1]))
+        return matches
+
+
+class PhotoIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tree = BKTree()
+        self.last_pk = 0
+        self.epoch = None
+
+    def _refresh(self):
+        epoch = cache.get(PHOTO_INDEX_EPOCH_KEY)
+        if epoch != self.epoch:
+            self.tree = BKTree()
+            self.last_pk = 0
+            self.epoch = epoch
+        rows = (
+            PotholeReport.objects.filter(pk__gt=self.last_pk)
+            .exclude(image_hash='')
+            .order_by('pk')
+            .values_list('pk', 'image_hash')
+        )
+        for pk, image_hash in rows.iterator():
+            self.tree.add(int(image_hash, 16), pk)
+            self.last_pk = pk
+
+    def candidates(self, image_hash, max_distance):
+        """(distance, report id) of indexed photos within max_distance bits, closest and newest first"""
+        with self.lock:
+            self._refresh()
+            return self.tree.search(int(image_hash, 16), max_distance)
+
+
+_photo_index = None
+_photo_index_lock = threading.Lock()
+
+
+def get_photo_index():
+    """The photo hash index for this worker process"""
+    global _photo_index
+    with _photo_index_lock:
+        if _photo_index is None:
+            _photo_index = PhotoIndex()
+    return _photo_index
+
+
+def rebuild_photo_indexes():
+    """Make every worker rebuild its index on its next lookup"""
+    try:
+        cache.incr(PHOTO_INDEX_EPOCH_KEY)
+    except ValueError:
+        cache.add(PHOTO_INDEX_EPOCH_KEY, 1, timeout=None)
+
+
+def find_previous_upload(image_hash, max_distance=None):
+    """The stored report whose photo is closest to image_hash, or None if none is within max_distance bits"""
+    if max_distance is None:
+        max_distance = settings.PHOTO_MATCH_MAX_DISTANCE
+    candidates = get_photo_index().candidates(image_hash, max_distance)
+    if not candidates:
+        return None
+    reports = PotholeReport.objects.in_bulk([pk for _, pk in candidates])
+    target = int(image_hash, 16)
+    for _, pk in candidates:
+        report = reports.get(pk)
+        if report is not None and report.image_hash and hamming(int(report.image_hash, 16), target) <= max_distance:
+            return report
+    return None
+
+
+def known_verdict(image_hash):
+    """The detection verdict of an earlier upload of the same photo, or None (see PotholeReport.detection_verdict)"""
+    previous = find_previous_upload(image_hash)
+    return previous.detection_verdict() if previous is not None else None
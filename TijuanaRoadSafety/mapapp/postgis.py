@@ -0,0 +1,90 @@
+"""
+Optional PostGIS spatial index for pothole reports.
+
+When USE_POSTGIS is enabled on a PostgreSQL database, mapapp_potholereport
+gets a geography(Point) column with a GiST index, kept in sync with
+latitude/longitude by a trigger. The column is managed here in raw SQL rather
+than through a GeoDjango field so the model (and SQLite development) does not
+depend on GDAL/GEOS being installed.
+"""
+from django.conf import settings
+from django.db import connection as default_connection
+
+TABLE = 'mapapp_potholereport'
+LOCATION_COLUMN = 'location'
+
+INSTALL_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS {LOCATION_COLUMN} geography(Point, 4326)",
+    f"""
+    CREATE OR REPLACE FUNCTION {TABLE}_set_location() RETURNS trigger AS $$
+    BEGIN
+        NEW.{LOCATION_COLUMN} := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326)::geography;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS {TABLE}_location_trigger ON {TABLE}",
+    f"""
+    CREATE TRIGGER {TABLE}_location_trigger
+    BEFORE INSERT OR UPDATE OF latitude, longitude ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION {TABLE}_set_location()
+    """,
+    f"""
+    UPDATE {TABLE}
+    SET {LOCATION_COLUMN} = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography
+    WHERE {LOCATION_COLUMN} IS NULL
+    """,
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_location_gist ON {TABLE} USING GIST ({LOCATION_COLUMN})",
+]
+
+NEARBY_SQL = f"""
+    SELECT id, ST_Distance({LOCATION_COLUMN}, point.geog) AS distance
+    FROM {TABLE}, (
+        SELECT ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography AS geog
+    ) AS point
+    WHERE ST_DWithin({LOCATION_COLUMN}, point.geog, %s)
+    ORDER BY {LOCATION_COLUMN} <-> point.geog
+"""
+
+
+def is_enabled(connection=None):
+    """True when spatial queries should go through PostGIS"""
+    connection = connection or default_connection
+    return getattr(settings, 'USE_POSTGIS', False) and connection.vendor == 'postgresql'
+
+
+def is_available(connection=None):
+    """True when the database is PostgreSQL and the postgis extension can be installed"""
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")
+        return cursor.fetchone() is not None
+
+
+def install(connection=None):
+    """Create (or repair) the location column, sync trigger and GiST index. Idempotent."""
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+
+
+def find_nearby(latitude, longitude, radius_meters, limit=None, connection=None):
+    """
+    Return [(id, distance_meters), ...] for reports within radius, nearest first.
+
+    ST_DWithin narrows the search with the GiST index and the KNN <-> operator
+    lets PostgreSQL stop after `limit` rows without sorting every match.
+    """
+    connection = connection or default_connection
+    sql = NEARBY_SQL
+    params = [longitude, latitude, radius_meters]
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(row[0], float(row[1])) for row in cursor.fetchall()]
@@ -0,0 +1,187 @@
+"""
+Zoom-level cluster pyramid for the public map.
+
+For every zoom level up to MAP_CLUSTER_MAX_ZOOM the Web Mercator plane is cut
+into square cells about MAP_CLUSTER_RADIUS_PX screen pixels wide, and each cell
+keeps running totals of the open reports inside it. Cells are snapped to a
+whole fraction of a 256px map tile so every cell nests inside exactly one tile.
+A viewport at any zoom is then answered with at most a few hundred cluster
+features instead of every report.
+
+The pyramid lives next to the per-worker report snapshot and is updated from
+its change notifications, so created, merged and resolved reports adjust a
+single cell per zoom level instead of triggering a rebuild. Levels are only
+built the first time they are requested.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from . import geo
+from .models import PotholeReport
+from .snapshot import STATUS_CODES, get_snapshot
+
+TILE_SIZE = 256
+
+# Layout of the running totals kept per cell
+COUNT, SUBMISSIONS, LAT_SUM, LON_SUM, ID_SUM, SEVERITY_COUNTS = 0, 1, 2, 3, 4, 5
+
+
+class ClusterPyramid:
+    def __init__(self, snapshot, max_zoom, radius_px):
+        self.snapshot = snapshot
+        self.max_zoom = max_zoom
+        self.cells_per_tile = max(1, round(TILE_SIZE / radius_px))
+        # Number of cells along each axis at every zoom level
+        self.scales = [self.cells_per_tile * (1 << zoom) for zoom in range(max_zoom + 1)]
+        self.levels = [None] * (max_zoom + 1)
+        self.open_codes = {STATUS_CODES[status] for status in PotholeReport.OPEN_STATUSES}
+        snapshot.subscribe(self.on_change)
+
+    def _build_level(self, zoom):
+        """Bin every open report of the snapshot into the cells of one zoom level"""
+        snapshot = self.snapshot
+        columns = snapshot.rows(snapshot.mask(statuses=PotholeReport.OPEN_STATUSES))
+        x, y = geo.mercator(columns['latitude'], columns['longitude'])
+        scale = self.scales[zoom]
+        cx = (x * scale).astype(np.int64)
+        cy = (y * scale).astype(np.int64)
+        keys, inverse = np.unique(cx * scale + cy, return_inverse=True)
+
+        def total(values):
+            return np.bincount(inverse, weights=values, minlength=len(keys))
+
+        counts = np.bincount(inverse, minlength=len(keys))
+        submissions = total(columns['submission_count'])
+        lat_sums = total(columns['latitude'])
+        lon_sums = total(columns['longitude'])
+        id_sums = np.bincount(inverse, weights=columns['id'], minlength=len(keys))
+        severities = np.zeros((len(keys), 5), dtype=np.int64)
+        np.add.at(severities, (inverse, columns['severity'].astype(np.int64) - 1), 1)
+
+        level = {}
+        for i, key in enumerate(keys.tolist()):
+            cell = (key // scale, key % scale)
+            level[cell] = [
+                int(counts[i]), int(submissions[i]), float(lat_sums[i]), float(lon_sums[i]),
+                int(id_sums[i]), severities[i].tolist(),
+            ]
+        self.levels[zoom] = level
+
+    def _apply(self, report, sign):
+        report_id, latitude, longitude, severity, submission_count, status = report
+        if status not in self.open_codes:
+            return
+        x, y = geo.mercator(latitude, longitude)
+        for zoom, level in enumerate(self.levels):
+            if level is None:
+                continue
+            cell = (int(x * self.scales[zoom]), int(y * self.scales[zoom]))
+            totals = level.get(cell)
+            if totals is None:
+                totals = level[cell] = [0, 0, 0.0, 0.0, 0, [0, 0, 0, 0, 0]]
+            totals[COUNT] += sign
+            totals[SUBMISSIONS] += sign * submission_count
+            totals[LAT_SUM] += sign * latitude
+            totals[LON_SUM] += sign * longitude
+            totals[ID_SUM] += sign * report_id
+            totals[SEVERITY_COUNTS][severity - 1] += sign
+            if totals[COUNT] == 0:
+                del level[cell]
+
+    def on_change(self, old, new):
+        """Snapshot listener: move one report between cells"""
+        if old is not None:
+            self._apply(old, -1)
+        if new is not None:
+            self._apply(new, 1)
+
+    def features(self, zoom, bbox):
+        """
+        GeoJSON features for the open reports in bbox (south, west, north,
+        east) at the given zoom. Cells holding a single report come back as
+        that report; the others as a cluster at the centroid of their reports.
+        """
+        zoom = min(zoom, self.max_zoom)
+        south, west, north, east = bbox
+        scale = self.scales[zoom]
+        x_min, y_min = geo.mercator(north, west)
+        x_max, y_max = geo.mercator(south, east)
+        return self.cell_features(
+            zoom,
+            range(int(x_min * scale), int(x_max * scale) + 1),
+            range(int(y_min * scale), int(y_max * scale) + 1),
+        )
+
+    def tile_features(self, zoom, x, y):
+        """Features of every cell inside slippy-map tile zoom/x/y (zoom <= max_zoom)"""
+        n = self.cells_per_tile
+        return self.cell_features(zoom, range(x * n, (x + 1) * n), range(y * n, (y + 1) * n))
+
+    def cell_features(self, zoom, x_range, y_range):
+        """Features of the non-empty cells within the given cell index ranges"""
+        with self.snapshot.lock:
+            if self.levels[zoom] is None:
+                self._build_level(zoom)
+            level = self.levels[zoom]
+
+            if len(x_range) * len(y_range) < len(level):
+                cells = [((cx, cy), level[(cx, cy)]) for cx in x_range for cy in y_range if (cx, cy) in level]
+            else:
+                cells = [
+                    (cell, totals) for cell, totals in level.items()
+                    if cell[0] in x_range and cell[1] in y_range
+                ]
+
+            return [self._feature(zoom, cell, totals) for cell, totals in sorted(cells)]
+
+    def _feature(self, zoom, cell, totals):
+        count = totals[COUNT]
+        latitude = totals[LAT_SUM] / count
+        longitude = totals[LON_SUM] / count
+        max_severity = max(i + 1 for i, n in enumerate(totals[SEVERITY_COUNTS]) if n > 0)
+        geometry = {'type': 'Point', 'coordinates': [round(longitude, 6), round(latitude, 6)]}
+
+        if count == 1:
+            # With one report in the cell the running id total is that report's id
+            return {
+                'type': 'Feature',
+                'id': totals[ID_SUM],
+                'geometry': geometry,
+                'properties': {
+                    'id': totals[ID_SUM],
+                    'severity': max_severity,
+                    'submission_count': totals[SUBMISSIONS],
+                },
+            }
+        return {
+            'type': 'Feature',
+            'id': f'c{zoom}-{cell[0]}-{cell[1]}-{count}',
+            'geometry': geometry,
+            'properties': {
+                'cluster': True,
+                'point_count': count,
+                'submission_count': totals[SUBMISSIONS],
+                'max_severity': max_severity,
+            },
+        }
+
+
+_pyramid = None
+_pyramid_lock = threading.Lock()
+
+
+def get_pyramid():
+    """The cluster pyramid for this worker process, kept in step with its snapshot"""
+    global _pyramid
+    snapshot = get_snapshot()
+    with _pyramid_lock:
+        if _pyramid is None:
+            with snapshot.lock:
+                _pyramid = ClusterPyramid(
+                    snapshot,
+                    max_zoom=settings.MAP_CLUSTER_MAX_ZOOM,
+                    radius_px=settings.MAP_CLUSTER_RADIUS_PX,
+                )
+    return _pyramid
@@ -0,0 +1,239 @@
+"""
+HTTP client for the hosted Roboflow model.
+
+One client per worker process (get_roboflow_client) keeps a requests Session
+with a bounded keep-alive connection pool, so detections reuse TLS
+connections instead of opening one per image. Every call is bounded:
+
+- connect and read timeouts (ROBOFLOW_CONNECT_TIMEOUT_SECONDS,
+  ROBOFLOW_TIMEOUT_SECONDS);
+- connection errors and 429/5xx answers are retried up to
+  ROBOFLOW_MAX_RETRIES times after a random "full jitter" backoff. A read
+  timeout is not retried: the server is already slow and a retry would only
+  add to its load and to the caller's wait;
+- a circuit breaker opens after ROBOFLOW_BREAKER_FAILURES consecutive failed
+  calls. While open, calls fail at once without touching the network, and
+  after ROBOFLOW_BREAKER_RESET_SECONDS a single trial call decides whether to
+  close it again.
+
+Failed calls return {'predictions': [], 'error': ...} like every detector
+backend. That is the degraded mode: submissions whose photo could not be
+checked are kept as pending reports for manual review instead of being
+rejected (see report_pothole and validate_report).
+
+Request counts, failures by kind, retries, fast failures and a latency
+histogram are added to counters in the shared cache, so
+`python manage.py detector_metrics` sees every worker. The API key is sent
+as a query parameter, as the API requires, and is removed from every error
+message before it is logged or returned.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from .caching import increment_counter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+METRICS_PREFIX = 'mapapp:roboflow:'
+# Upper bounds in milliseconds of the latency histogram buckets
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+COUNTERS = (
+    'requests', 'successes', 'failures', 'retries', 'short_circuited', 'breaker_opened',
+    'timeouts', 'connection_errors', 'http_errors', 'latency_ms',
+)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold, reset_seconds, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Whether a call may go ahead; once the reset time has passed, only one trial call at a time"""
+        with self.lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """Count a failed call; returns True if this failure opened the breaker"""
+        with self.lock:
+            self.failures += 1
+            was_closed = self.opened_at is None
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+            return was_closed and self.opened_at is not None
+
+
+class RoboflowClient:
+    def __init__(self, model_url, api_key, connect_timeout, read_timeout, max_retries,
+                 backoff_seconds, pool_size, breaker):
+        self.model_url = model_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker
+        self.session = requests.Session()
+        # Retries are handled in infer(), where they can back off with jitter
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls, model_url):
+        return cls(
+            model_url=model_url,
+            api_key=settings.ROBOFLOW_API_KEY,
+            connect_timeout=settings.ROBOFLOW_CONNECT_TIMEOUT_SECONDS,
+            read_timeout=settings.ROBOFLOW_TIMEOUT_SECONDS,
+            max_retries=settings.ROBOFLOW_MAX_RETRIES,
+            backoff_seconds=settings.ROBOFLOW_BACKOFF_SECONDS,
+            pool_size=settings.ROBOFLOW_MAX_CONCURRENCY,
+            breaker=CircuitBreaker(settings.ROBOFLOW_BREAKER_FAILURES, settings.ROBOFLOW_BREAKER_RESET_SECONDS),
+        )
+
+    def _redact(self, message):
+        return message.replace(self.api_key, '***') if self.api_key else message
+
+    def infer(self, image):
+        """The model's predictions for an encoded JPEG, or no predictions plus an 'error' entry"""
+        if not self.api_key:
+            return {'predictions': [], 'error': 'ROBOFLOW_API_KEY is not set'}
+        if not self.breaker.allow():
+            increment_counter(METRICS_PREFIX + 'short_circuited')
+            return {'predictions': [], 'error': 'Roboflow unavailable (circuit open)'}
+
+        error = None
+        settled = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    increment_counter(METRICS_PREFIX + 'retries')
+                    # Full jitter: concurrent workers do not retry in lockstep
+                    time.sleep(random.uniform(0, self.backoff_seconds * 2 ** (attempt - 1)))
+                result, error, retry = self._attempt(image)
+                if result is not None:
+                    settled = True
+                    self.breaker.record_success()
+                    increment_counter(METRICS_PREFIX + 'successes')
+                    return result
+                if not retry:
+                    break
+            settled = True
+        finally:
+            # An unexpected exception counts as a failure, which also ends a
+            # half-open trial call; otherwise the breaker would stay open
+            if not settled:
+                self.breaker.record_failure()
+
+        increment_counter(METRICS_PREFIX + 'failures')
+        if self.breaker.record_failure():
+            increment_counter(METRICS_PREFIX + 'breaker_opened')
+            logger.error("Roboflow circuit breaker opened")
+        logger.error(f"Roboflow detection failed: {error}")
+        return {'predictions': [], 'error': error}
+
+    def _attempt(self, image):
+        """One request; returns (result, error, retry)"""
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                self.model_url,
+                params={'api_key': self.api_key},
+                files={'file': ('image.jpg', image, 'image/jpeg')},
+                timeout=self.timeout,
+            )
+        except requests.Timeout as e:
+            self._observe(started, 'timeouts')
+            # Only a timeout while connecting is worth retrying
+            return None, self._redact(f'Timeout: {e}'), isinstance(e, requests.ConnectTimeout)
+        except requests.RequestException as e:
+            self._observe(started, 'connection_errors')
+            return None, self._redact(f'{type(e).__name__}: {e}'), True
+
+        if response.status_code != 200:
+            self._observe(started, 'http_errors')
+            return None, f'HTTP {response.status_code}', response.status_code in RETRY_STATUSES
+        try:
+            result = response.json()
+        except ValueError:
+            self._observe(started, 'http_errors')
+            return None, 'Invalid JSON in response', False
+        self._observe(started)
+        return result, None, False
+
+    def _observe(self, started, error_kind=None):
+        elapsed_ms = round((time.monotonic() - started) * 1000)
+        increment_counter(METRICS_PREFIX + 'requests')
+        increment_counter(METRICS_PREFIX + 'latency_ms', elapsed_ms)
+        bucket = next((bound for bound in LATENCY_BUCKETS_MS if elapsed_ms <= bound), 'inf')
+        increment_counter(f'{METRICS_PREFIX}latency_le_{bucket}')
+        if error_kind:
+            increment_counter(METRICS_PREFIX + error_kind)
+
+
+def metrics():
+    """Counters of Roboflow calls from every worker, with a latency histogram {bucket upper bound: requests}"""
+    keys = [METRICS_PREFIX + name for name in COUNTERS]
+    bucket_keys = [f'{METRICS_PREFIX}latency_le_{bound}' for bound in (*LATENCY_BUCKETS_MS, 'inf')]
+    values = cache.get_many(keys + bucket_keys)
+    counters = {name: values.get(key, 0) for name, key in zip(COUNTERS, keys)}
+    counters['latency_histogram'] = {
+        bound: values.get(key, 0) for bound, key in zip((*LATENCY_BUCKETS_MS, 'inf'), bucket_keys)
+    }
+    return counters
+
+
+def reset_metrics():
+    cache.delete_many(
+        [METRICS_PREFIX + name for name in COUNTERS]
+        + [f'{METRICS_PREFIX}latency_le_{bound}' for bound in (*LATENCY_BUCKETS_MS, 'inf')]
+    )
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_roboflow_client(model_url):
+    """The client for a model URL in this worker process"""
+    with _clients_lock:
+        if model_url not in _clients:
+            _clients[model_url] = RoboflowClient.from_settings(model_url)
+    return _clients[model_url]
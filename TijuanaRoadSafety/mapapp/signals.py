@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_reports
+from .models import PotholeReport
+
+
+@receiver(post_save, sender=PotholeReport)
+@receiver(post_delete, sender=PotholeReport)
+def report_changed(sender, **kwargs):
+    invalidate_reports()
@@ -0,0 +1,249 @@
+"""
+Per-worker columnar snapshot of report coordinates.
+
+Hot paths that need every report but only a handful of numeric columns
+(map markers, nearby checks, density analysis) read from NumPy arrays held
+once per process instead of building PotholeReport instances on each request.
+The snapshot refreshes incrementally: only rows whose last_updated moved since
+the previous refresh are read back from the database.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from . import geo
+from .caching import reports_version
+from .models import PotholeReport
+
+STATUSES = [value for value, _ in PotholeReport._meta.get_field('status').choices]
+STATUS_CODES = {value: code for code, value in enumerate(STATUSES)}
+
+# Rows updated this long before the newest timestamp seen are read again on the
+# next refresh, so a transaction that commits late is never skipped
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+SNAPSHOT_FIELDS = ('id', 'latitude', 'longitude', 'severity', 'submission_count', 'status', 'last_updated')
+
+
+class ReportSnapshot:
+    """Parallel arrays of report columns; row i of every array is the same report"""
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        # Report id -> row (-1 when absent). Ids are auto-increment keys, so a
+        # direct-address array costs 4 bytes per id instead of a dict entry.
+        self.row_of = np.full(capacity, -1, dtype=np.int32)
+        self.watermark = None
+        self.refreshed_at = 0.0
+        self.version = None
+        self.lock = threading.RLock()
+        self.listeners = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        def grow(name, dtype):
+            new = np.zeros(capacity, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+        grow('ids', np.int64)
+        grow('latitudes', np.float64)
+        grow('longitudes', np.float64)
+        grow('severities', np.int8)
+        grow('submission_counts', np.int32)
+        grow('statuses', np.int8)
+        grow('alive', np.bool_)
+
+    @classmethod
+    def from_arrays(cls, ids, latitudes, longitudes, severities, submission_counts, statuses):
+        """Build a snapshot directly from column arrays (used by benchmarks)"""
+        snapshot = cls(capacity=max(len(ids), 1))
+        n = len(ids)
+        snapshot.ids[:n] = ids
+        snapshot.latitudes[:n] = latitudes
+        snapshot.longitudes[:n] = longitudes
+        snapshot.severities[:n] = severities
+        snapshot.submission_counts[:n] = submission_counts
+        snapshot.statuses[:n] = statuses
+        snapshot.alive[:n] = True
+        snapshot.size = n
+        snapshot._index_ids(int(np.max(ids, initial=0)))
+        snapshot.row_of[snapshot.ids[:n]] = np.arange(n, dtype=np.int32)
+        return snapshot
+
+    def _index_ids(self, max_id):
+        """Make sure row_of can be indexed by max_id"""
+        if max_id >= len(self.row_of):
+            new = np.full(max(max_id + 1, len(self.row_of) * 2), -1, dtype=np.int32)
+            new[:len(self.row_of)] = self.row_of
+            self.row_of = new
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.ids, self.latitudes, self.longitudes, self.severities,
+            self.submission_counts, self.statuses, self.alive, self.row_of,
+        ))
+
+    def __len__(self):
+        return int(self.alive[:self.size].sum())
+
+    def subscribe(self, listener):
+        """
+        Call listener(old, new) for every row changed by later refreshes, where
+        old and new are (id, latitude, longitude, severity, submission_count,
+        status_code) tuples, old is None for new reports and new is None for
+        deleted ones. Subscribe while holding `lock` to avoid missing changes.
+        """
+        self.listeners.append(listener)
+
+    def _row(self, row):
+        return (
+            int(self.ids[row]), float(self.latitudes[row]), float(self.longitudes[row]),
+            int(self.severities[row]), int(self.submission_counts[row]), int(self.statuses[row]),
+        )
+
+    def _notify(self, old, new):
+        if old != new:
+            for listener in self.listeners:
+                listener(old, new)
+
+    def _upsert(self, report_id, latitude, longitude, severity, submission_count, status):
+        self._index_ids(report_id)
+        row = int(self.row_of[report_id])
+        old = self._row(row) if row >= 0 and self.alive[row] else None
+        if row < 0:
+            if self.size == len(self.ids):
+                self._allocate(len(self.ids) * 2)
+            row = self.size
+            self.size += 1
+            self.row_of[report_id] = row
+            self.ids[row] = report_id
+        self.latitudes[row] = latitude
+        self.longitudes[row] = longitude
+        self.severities[row] = severity
+        self.submission_counts[row] = submission_count
+        self.statuses[row] = STATUS_CODES.get(status, 0)
+        self.alive[row] = True
+        if self.listeners:
+            self._notify(old, self._row(row))
+
+    def refresh(self, force=False):
+        """
+        Pull rows changed since the last refresh. Unless forced, calls are
+        skipped while the reports version (see caching.py) is unchanged and
+        the last refresh is less than REPORT_SNAPSHOT_REFRESH_SECONDS old;
+        the interval catches changes that did not bump the version.
+        """
+        interval = getattr(settings, 'REPORT_SNAPSHOT_REFRESH_SECONDS', 2)
+        version = reports_version()
+        with self.lock:
+            if not force and version == self.version and time.monotonic() - self.refreshed_at < interval:
+                return
+            self.version = version
+
+            queryset = PotholeReport.objects.values_list(*SNAPSHOT_FIELDS)
+            if self.watermark is not None:
+                queryset = queryset.filter(last_updated__gte=self.watermark - REFRESH_OVERLAP)
+
+            for report_id, latitude, longitude, severity, count, status, last_updated in queryset.iterator():
+                self._upsert(report_id, latitude, longitude, severity, count, status)
+                if self.watermark is None or last_updated > self.watermark:
+                    self.watermark = last_updated
+
+            # Deletions leave no trace in last_updated; only look for them when the counts disagree
+            if PotholeReport.objects.count() != len(self):
+                existing = np.fromiter(PotholeReport.objects.values_list('id', flat=True), dtype=np.int64)
+                alive = np.isin(self.ids[:self.size], existing)
+                for row in np.flatnonzero(self.alive[:self.size] & ~alive):
+                    self._notify(self._row(row), None)
+                self.alive[:self.size] = alive
+
+            self.refreshed_at = time.monotonic()
+
+    def mask(self, statuses=None, min_severity=None, bbox=None):
+        """
+        Boolean mask over rows [0, size) of live reports matching the filters.
+        bbox is (south, west, north, east) in degrees.
+        """
+        n = self.size
+        mask = self.alive[:n].copy()
+        if statuses is not None:
+            allowed = np.zeros(len(STATUSES), dtype=np.bool_)
+            allowed[[STATUS_CODES[status] for status in statuses]] = True
+            mask &= allowed[self.statuses[:n]]
+        if min_severity is not None:
+            mask &= self.severities[:n] >= min_severity
+        if bbox is not None:
+            south, west, north, east = bbox
+            latitudes = self.latitudes[:n]
+            longitudes = self.longitudes[:n]
+            mask &= (latitudes >= south) & (latitudes <= north)
+            mask &= (longitudes >= west) & (longitudes <= east)
+        return mask
+
+    def rows(self, mask):
+        """Column arrays for the rows selected by mask"""
+        n = self.size
+        return {
+            'id': self.ids[:n][mask],
+            'latitude': self.latitudes[:n][mask],
+            'longitude': self.longitudes[:n][mask],
+            'severity': self.severities[:n][mask],
+            'submission_count': self.submission_counts[:n][mask],
+            'status': self.statuses[:n][mask],
+        }
+
+    def features(self, columns):
+        """GeoJSON point features for column arrays returned by rows()"""
+        return [
+            {
+                'type': 'Feature',
+                'id': report_id,
+                'geometry': {'type': 'Point', 'coordinates': [round(longitude, 6), round(latitude, 6)]},
+                'properties': {
+                    'id': report_id,
+                    'severity': severity,
+                    'submission_count': submission_count,
+                    'status': STATUSES[status],
+                },
+            }
+            for report_id, latitude, longitude, severity, submission_count, status in zip(
+                columns['id'].tolist(), columns['latitude'].tolist(), columns['longitude'].tolist(),
+                columns['severity'].tolist(), columns['submission_count'].tolist(), columns['status'].tolist(),
+            )
+        ]
+
+    def within_radius(self, latitude, longitude, radius_meters, statuses=None):
+        """Return (ids, distances) of live reports within radius, nearest first"""
+        lat_margin = radius_meters / geo.METERS_PER_DEGREE
+        lon_margin = lat_margin / max(np.cos(np.radians(latitude)), 1e-6)
+        mask = self.mask(statuses=statuses, bbox=(
+            latitude - lat_margin, longitude - lon_margin,
+            latitude + lat_margin, longitude + lon_margin,
+        ))
+        rows = np.flatnonzero(mask)
+        distances = geo.haversine_distance(latitude, longitude, self.latitudes[rows], self.longitudes[rows])
+        keep = distances <= radius_meters
+        rows, distances = rows[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return self.ids[rows[order]], distances[order]
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """The refreshed snapshot for this worker process"""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = ReportSnapshot()
+    _snapshot.refresh()
+    return _snapshot
@@ -0,0 +1,108 @@
+"""
+Slippy-map z/x/y tiles of pothole markers.
+
+A tile holds the clusters of the pyramid cells inside it (up to
+MAP_CLUSTER_MAX_ZOOM) or the individual open reports inside it (deeper zooms),
+so every marker belongs to exactly one tile per zoom level. Each tile keeps a
+version that is bumped by the snapshot change feed only when a report inside
+it changes, and its rendered body is cached against that version. The ETag is
+a hash of the body, so it is the same on every worker and lets browsers and
+CDNs revalidate unchanged tiles without downloading them again.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from . import geo, packing
+from .models import PotholeReport
+from .pyramid import get_pyramid
+
+MAX_TILE_ZOOM = 22
+
+# Rendered tiles kept per worker
+MAX_CACHED_TILES = 4096
+
+
+class TileIndex:
+    def __init__(self, snapshot, pyramid, max_zoom=MAX_TILE_ZOOM, max_cached=MAX_CACHED_TILES):
+        self.snapshot = snapshot
+        self.pyramid = pyramid
+        self.max_zoom = max_zoom
+        self.max_cached = max_cached
+        self.versions = defaultdict(int)
+        # (z, x, y, packed) -> (version, body, etag), least recently used first
+        self.rendered = OrderedDict()
+        snapshot.subscribe(self.on_change)
+
+    def _bump(self, report):
+        x, y = geo.mercator(report[1], report[2])
+        for zoom in range(self.max_zoom + 1):
+            n = 1 << zoom
+            self.versions[(zoom, int(x * n), int(y * n))] += 1
+
+    def on_change(self, old, new):
+        """Snapshot listener: invalidate the tile containing the report at each zoom"""
+        if old is not None:
+            self._bump(old)
+        if new is not None and (old is None or old[1:3] != new[1:3]):
+            self._bump(new)
+
+    def version(self, zoom, x, y):
+        return self.versions.get((zoom, x, y), 0)
+
+    def features(self, zoom, x, y):
+        """GeoJSON features of tile zoom/x/y"""
+        if zoom <= self.pyramid.max_zoom:
+            return self.pyramid.tile_features(zoom, x, y)
+
+        snapshot = self.snapshot
+        mask = snapshot.mask(statuses=PotholeReport.OPEN_STATUSES, bbox=geo.tile_bounds(zoom, x, y))
+        columns = snapshot.rows(mask)
+        # Reports exactly on an edge fall inside both bounding boxes; keep them in one tile only
+        n = 1 << zoom
+        mx, my = geo.mercator(columns['latitude'], columns['longitude'])
+        inside = ((mx * n).astype(np.int64) == x) & ((my * n).astype(np.int64) == y)
+        return snapshot.features({name: values[inside] for name, values in columns.items()})
+
+    def render(self, zoom, x, y, packed=False):
+        """
+        Return (body, etag) of tile zoom/x/y as JSON or, when packed, in the
+        binary point format, rendering it only if it changed
+        """
+        key = (zoom, x, y, packed)
+        with self.snapshot.lock:
+            version = self.version(zoom, x, y)
+            cached = self.rendered.get(key)
+            if cached is not None and cached[0] == version:
+                self.rendered.move_to_end(key)
+                return cached[1], cached[2]
+
+            features = self.features(zoom, x, y)
+            if packed:
+                body = packing.encode_features(features)
+            else:
+                body = json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':')).encode()
+            etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+            self.rendered[key] = (version, body, etag)
+            self.rendered.move_to_end(key)
+            if len(self.rendered) > self.max_cached:
+                self.rendered.popitem(last=False)
+            return body, etag
+
+
+_tile_index = None
+_tile_index_lock = threading.Lock()
+
+
+def get_tile_index():
+    """The tile index for this worker process, kept in step with its snapshot"""
+    global _tile_index
+    pyramid = get_pyramid()
+    with _tile_index_lock:
+        if _tile_index is None:
+            with pyramid.snapshot.lock:
+                _tile_index = TileIndex(pyramid.snapshot, pyramid)
+    return _tile_index
@@ -0,0 +1,189 @@
+"""
+Streaming checks on uploaded photos.
+
+ImageUploadHandler replaces Django's upload handlers on the report and audit
+forms (see the image_uploads decorator). While an upload arrives it:
+
+- hashes the bytes (SHA-256, exposed as the file's .sha256);
+- sniffs the magic bytes, so anything but JPEG or PNG is refused after the
+  first chunk;
+- reads the image dimensions from the header as soon as it has arrived,
+  without decoding pixels, and refuses images over MAX_UPLOAD_PIXELS, which
+  stops decompression bombs before Pillow allocates anything;
+- refuses uploads over MAX_UPLOAD_BYTES.
+
+Once an upload is refused the rest of it is read and thrown away, and the
+form receives a RejectedUpload carrying the reason, which PhotoField turns
+into a form error. Accepted uploads are kept in memory up to
+FILE_UPLOAD_MAX_MEMORY_SIZE and spill to a temporary file beyond it, so each
+concurrent upload holds a bounded amount of memory while it streams in.
+"""
+import hashlib
+import io
+import struct
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import JpegImagePlugin
+
+MAGIC_NUMBERS = {
+    'JPEG': b'\xff\xd8\xff',
+    'PNG': b'\x89PNG\r\n\x1a\n',
+}
+
+# Bytes of the start of an upload kept for reading its header; JPEG metadata
+# segments before the frame header are at most 64 KiB each
+HEADER_BYTES = 256 * 1024
+
+WRONG_TYPE = 'Error: por favor, envíe únicamente archivos .jpg o .png.'
+UNREADABLE = 'No se pudo leer la imagen. Por favor, envíe otra foto.'
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def sniff(head, complete=False):
+    """
+    (format, (width, height)) of an image from the first bytes of its file,
+    or None if more bytes are needed. Raises UploadRejected for files that
+    are not JPEG or PNG or have more than MAX_UPLOAD_PIXELS pixels.
+    complete means head is the whole file.
+    """
+    head = bytes(head)
+    image_format = next((name for name, magic in MAGIC_NUMBERS.items() if head.startswith(magic)), None)
+    if image_format is None:
+        if len(head) >= 8 or complete:
+            raise UploadRejected(WRONG_TYPE)
+        return None
+
+    size = None
+    if image_format == 'PNG':
+        # The IHDR chunk, with the size, always comes first
+        if len(head) >= 24 and head[12:16] == b'IHDR':
+            size = struct.unpack('>II', head[16:24])
+        elif len(head) >= 16:
+            raise UploadRejected(UNREADABLE)
+    else:
+        try:
+            # Only parses the markers up to the frame header; nothing is decoded
+            size = JpegImagePlugin.JpegImageFile(io.BytesIO(head)).size
+        except Exception:
+            pass
+    if size is None:
+        if complete or len(head) >= HEADER_BYTES:
+            raise UploadRejected(UNREADABLE)
+        return None
+    if size[0] * size[1] > settings.MAX_UPLOAD_PIXELS:
+        raise UploadRejected(too_many_pixels())
+    return image_format, size
+
+
+def too_many_pixels():
+    return f'La imagen tiene demasiados píxeles (máximo {settings.MAX_UPLOAD_PIXELS // 1_000_000} megapíxeles).'
+
+
+def too_large():
+    return f'La imagen es demasiado grande (máximo {settings.MAX_UPLOAD_BYTES // (1024 * 1024)} MB).'
+
+
+def check_image_bytes(data):
+    """sniff() for an image that is already in memory, such as WhatsApp media"""
+    if len(data) > settings.MAX_UPLOAD_BYTES:
+        raise UploadRejected(too_large())
+    return sniff(data[:HEADER_BYTES], complete=len(data) <= HEADER_BYTES)
+
+
+class RejectedUpload(SimpleUploadedFile):
+    """An empty stand-in for a refused upload; upload_error says why"""
+
+    def __init__(self, name, upload_error):
+        super().__init__(name, b'')
+        self.upload_error = upload_error
+
+
+class ImageUploadHandler(FileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.head = bytearray()
+        self.sniffed = None
+        self.upload_error = None
+        self.received = 0
+        self.memory = io.BytesIO()
+        self.spilled = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload_error:
+            return None
+        self.received += len(raw_data)
+        try:
+            if self.received > settings.MAX_UPLOAD_BYTES:
+                raise UploadRejected(too_large())
+            if self.sniffed is None:
+                self.head += raw_data[:HEADER_BYTES - len(self.head)]
+                self.sniffed = sniff(self.head)
+        except UploadRejected as e:
+            self._reject(str(e))
+            return None
+
+        self.digest.update(raw_data)
+        if self.spilled is None and self.received > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            # Too big to keep in memory: continue in a temporary file
+            self.spilled = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+            self.spilled.write(self.memory.getvalue())
+            self.memory = None
+        (self.spilled or self.memory).write(raw_data)
+        return None
+
+    def _reject(self, upload_error):
+        self.upload_error = upload_error
+        self.head = None
+        if self.spilled is not None:
+            self.spilled.close()
+        self.memory = self.spilled = None
+
+    def file_complete(self, file_size):
+        if self.upload_error is None and self.sniffed is None:
+            try:
+                self.sniffed = sniff(self.head, complete=True)
+            except UploadRejected as e:
+                self._reject(str(e))
+        if self.upload_error is not None:
+            return RejectedUpload(self.file_name, self.upload_error)
+
+        if self.spilled is not None:
+            upload = self.spilled
+            upload.flush()
+            upload.seek(0)
+            upload.size = file_size
+        else:
+            self.memory.seek(0)
+            upload = InMemoryUploadedFile(
+                self.memory, self.field_name, self.file_name, self.content_type,
+                file_size, self.charset, self.content_type_extra,
+            )
+        upload.sha256 = self.digest.hexdigest()
+        upload.image_format, upload.image_size = self.sniffed
+        return upload
+
+
+def image_uploads(view):
+    """
+    Parse the file uploads of a view with ImageUploadHandler. Upload handlers
+    can only be replaced before the request body is read, which
+    CsrfViewMiddleware would otherwise do first, so the view is exempted
+    from the middleware and its CSRF check runs here instead.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+
+    return wrapper
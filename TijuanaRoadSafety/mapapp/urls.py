@@ -9,5 +9,10 @@ urlpatterns = [
     path('thank_you/', views.thank_you, name = 'thank_you'),
     path('whatsapp-webhook/', views.whatsapp_webhook, name = 'whatsapp-webhook'),
     path('api/check-nearby-potholes/', views.check_nearby_potholes, name='check_nearby_potholes'),
+    path('api/reports/<int:report_id>/status/', views.report_status, name='report_status'),
     path('api/increment-pothole-count/', views.increment_pothole_count, name='increment_pothole_count'),
+    path('api/map-data/', views.map_data, name='map_data'),
+    path('api/density/', views.density_data, name='density_data'),
+    path('tiles/<int:z>/<int:x>/<int:y>.json', views.map_tile, name='map_tile'),
+    path('tiles/<int:z>/<int:x>/<int:y>.bin', views.map_tile, {'packed': True}, name='map_tile_packed'),
 ]
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Out-of-band validation of web submissions.
+
+With DEFERRED_VALIDATION on, report_pothole submits the upload as a report
+awaiting validation (status 'validating', which no public view shows) and
+returns at once. validate_report then runs the detector on a background
+thread and writes the outcome to the report's status (see
+PotholeReport.apply_validation), which the thank-you page polls.
+
+When the detection API cannot be reached the report is left pending for
+manual review, as the synchronous path does. Jobs only live in the worker
+process: if it restarts before a job runs, the report stays awaiting
+validation. `python manage.py requeue_validations` validates such stale
+reports again; the release phase runs it on every deploy, and it can run
+periodically.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .detection import evaluate_detection
+from .images import DecodedImage
+from .inference_cache import detect_pothole
+from .models import PotholeReport
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DEFERRED_VALIDATION_WORKERS,
+                thread_name_prefix='report-validation',
+            )
+    return _executor
+
+
+def schedule_validation(report_id):
+    """Validate a report once the current transaction has committed it"""
+    transaction.on_commit(lambda: _start(report_id))
+
+
+def _start(report_id):
+    if settings.DEFERRED_VALIDATION_WORKERS <= 0:
+        validate_report(report_id)
+    else:
+        get_executor().submit(_run_in_background, report_id)
+
+
+def _run_in_background(report_id):
+    close_old_connections()
+    try:
+        validate_report(report_id)
+    except Exception:
+        logger.exception(f"Validation of report {report_id} failed")
+    finally:
+        close_old_connections()
+
+
+def detection_image(report):
+    """
+    The JPEG to run detection on: the stored large derivative when it is
+    already a JPEG, so the original does not have to be decoded again
+    """
+    if report.image_large and report.image_large.name.endswith('.jpg'):
+        with report.image_large.open('rb') as derivative:
+            return derivative.read()
+    with report.image.open('rb') as image_file:
+        return DecodedImage.from_file(image_file).detection_jpeg()
+
+
+def validate_report(report_id):
+    """
+    Run detection on a report awaiting validation and record the outcome;
+    if the detector cannot be reached the report goes to manual review.
+    Returns the updated report, or None if it was no longer awaiting
+    validation.
+    """
+    report = PotholeReport.objects.filter(pk=report_id, status='validating').first()
+    if report is None:
+        return None
+
+    result = detect_pothole(detection_image(report))
+
+    if 'error' in result:
+        # Degraded mode, as in the synchronous path: show the report pending
+        # manual review rather than hiding it until someone requeues it
+        logger.warning(f"Detection failed for report {report_id}, leaving it for review: {result['error']}")
+        report = PotholeReport.apply_validation(report, None)
+        logger.info(f"Report {report_id} saved for review: {report.status}")
+        return report
+
+    accepted, confidence = evaluate_detection(result)
+    report = PotholeReport.apply_validation(report, accepted, confidence)
+    logger.info(f"Report {report_id} validated: {report.status}")
+    return report
+
+
+def stale_validations(older_than_seconds):
+    """Reports still awaiting validation after older_than_seconds, whose job was lost or failed"""
+    from django.utils import timezone
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    return PotholeReport.objects.filter(status='validating', last_updated__lt=cutoff).order_by('pk')
@@ -1,80 +1,70 @@
-import os
-import tempfile
+import json
 import requests
 import logging
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from urllib.parse import urlencode
 from django.core.files.base import ContentFile
 from django.conf import settings
 from django.db.models import F
 
 # Set up logging
 logger = logging.getLogger(__name__)
-# Twilio imports temporarily disabled for deployment
-# try:
-#     from twilio.twiml.messaging_response import MessagingResponse
-#     TWILIO_AVAILABLE = True
-# except ImportError:
-#     TWILIO_AVAILABLE = False
-#     MessagingResponse = None
-TWILIO_AVAILABLE = False
-
-# Roboflow AI detection using HTTP API (no OpenCV required)
-def detect_pothole_via_api(image_path, api_key):
-    """
-    Use Roboflow's HTTP API to detect potholes without requiring OpenCV
-    """
-    if not api_key:
-        return {'predictions': []}
-    
-    try:
-        # Read image file
-        with open(image_path, 'rb') as image_file:
-            # Roboflow API endpoint
-            api_url = "https://detect.roboflow.com/pothole-detection-bqu6s/9"
-            
-            # Make API request
-            response = requests.post(
-                f"{api_url}?api_key={api_key}",
-                files={"file": image_file}
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Roboflow API error: {response.status_code}")
-                return {'predictions': []}
-                
-    except Exception as e:
-        print(f"Roboflow API exception: {e}")
-        return {'predictions': []}
-
-AI_AVAILABLE = bool(settings.ROBOFLOW_API_KEY)
 
+from .detection import AI_AVAILABLE, evaluate_detection
+from .inference_cache import detect_pothole
 from .forms import PotholeReportForm
-from .models import PotholeReport
+from .models import PotholeRanking, PotholeReport
 from .forms import AuditReportForm
-from PIL import Image
-
+from . import geo, packing
+from .caching import cached
+from .density import get_density_grid
+from .photo_index import known_verdict
+from .pyramid import get_pyramid
+from .validation import schedule_validation
+from .snapshot import get_snapshot
+from .tiles import MAX_TILE_ZOOM, get_tile_index
+from .uploads import image_uploads
+from . import whatsapp, whatsapp_media
+from .conversations import normalize_number
+
+
+def leaderboard_rows():
+    """Top open potholes ranked by submission count, then by latest submission date, as plain cacheable values"""
+    return [
+        {
+            'id': pothole.id,
+            'image_url': pothole.small_image_url,
+            'street_name': pothole.get_street_name(),
+            'submission_count': pothole.submission_count,
+            'severity': pothole.severity,
+            'latest_submission_date': pothole.latest_submission_date,
+            'timestamp': pothole.timestamp,
+        }
+        for pothole in PotholeRanking.top(10, statuses=PotholeReport.OPEN_STATUSES)
+    ]
 
 def home(request):
-    reports = PotholeReport.objects.all()
-    # Get top potholes ranked by submission count, then by latest submission date
-    top_potholes = PotholeReport.objects.all().order_by('-submission_count', '-latest_submission_date')[:10]
-    
-    # Debug: Print image URLs to console
-    for pothole in top_potholes:
-        if pothole.image:
-            print(f"Pothole #{pothole.id} image URL: {pothole.image.url}")
-            print(f"Pothole #{pothole.id} image path: {pothole.image.path}")
-    
+    # Map markers are loaded per viewport from map_data, so the page size no longer grows with the table.
+    # The leaderboard is cached until the next report change
     return render(request, 'home.html', {
-        'reports': reports, 
-        'top_potholes': top_potholes,
+        'top_potholes': cached('leaderboard', leaderboard_rows),
         'google_maps_api_key': settings.GOOGLE_MAPS_API_KEY
     })
 
+def merge_choice(request):
+    """submit() arguments for the reporter's answer in the nearby potholes dialog of the report page"""
+    merge_into = request.POST.get('merge_into', '')
+    return {
+        'merge_into': int(merge_into) if merge_into.isdigit() else None,
+        'merge': request.POST.get('new_pothole') != '1',
+    }
+
+@image_uploads
 def report_pothole(request):
     logger.info(f"report_pothole view called with method: {request.method}")
     
@@ -85,67 +75,56 @@ def report_pothole(request):
         if form.is_valid():
             logger.info("Form is valid, processing submission")
             image_file = form.cleaned_data['image']
-            logger.info(f"Image file received: {image_file.name}, size: {image_file.size} bytes")
+            logger.info(f"Image file received: {image_file.name}, size: {image_file.size} bytes, sha256: {image_file.sha256[:12]}")
+            choice = merge_choice(request)
+
+            # A photo that went through detection before keeps its verdict
+            verdict = known_verdict(image_file.decoded.image_hash()) if AI_AVAILABLE else None
+            if verdict is not None:
+                logger.info("Photo was uploaded before, reusing its detection verdict")
+
+            if AI_AVAILABLE and settings.DEFERRED_VALIDATION and verdict is None:
+                # Store the upload out of public view and run detection out of band
+                report = form.save(commit=False)
+                report.status = 'validating'
+                report, _ = PotholeReport.submit(report, **choice)
+                schedule_validation(report.id)
+                logger.info(f"Pothole report {report.id} saved, validation deferred")
+                return redirect_to_thank_you(report, False, validating=True)
 
             try:
-                with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                    image = Image.open(image_file)
-                    logger.info(f"Image opened successfully, mode: {image.mode}, size: {image.size}")
-                    
-                    # Convert RGBA to RGB before saving as JPEG
-                    if image.mode == 'RGBA':
-                        # Create a white background image
-                        background = Image.new('RGB', image.size, (255, 255, 255))
-                        # Paste the image on the background
-                        background.paste(image, mask=image.split()[3])  # 3 is the alpha channel
-                        # Save the new image
-                        background.save(temp_file, format='JPEG')
-                        logger.info("Image converted from RGBA to RGB")
-                    else:
-                        # If it's already RGB, just save it
-                        image.save(temp_file, format='JPEG')
-                        logger.info("Image saved as JPEG")
-                    temp_file_path = temp_file.name
-
                 #ROBOFLOW MODEL IMAGE INFERENCE
-                try:
-                    if AI_AVAILABLE:
+                if AI_AVAILABLE:
+                    if verdict is None:
                         logger.info("Running AI pothole detection")
-                        result = detect_pothole_via_api(temp_file_path, settings.ROBOFLOW_API_KEY)
+                        result = detect_pothole(image_file.decoded.detection_jpeg())
                         logger.info(f"AI detection result: {len(result.get('predictions', []))} predictions")
-                    else:
-                        result = {'predictions': []}
-                        logger.info("AI detection not available, skipping")
+                        if 'error' in result:
+                            # Degraded mode: keep the report pending for manual review
+                            # rather than rejecting a photo nobody could check
+                            logger.warning(f"Detection unavailable, saving report for review: {result['error']}")
+                            pothole, merged = PotholeReport.submit(form.save(commit=False), **choice)
+                            return redirect_to_thank_you(pothole, merged)
+                        verdict = evaluate_detection(result)
+                    accepted, confidence = verdict
                     
-                    if result['predictions']:
-                        prediction = result['predictions'][0] 
-                        logger.info(f"AI prediction: class={prediction.get('class')}, confidence={prediction.get('confidence')}")
-                        
-                        if prediction['confidence'] >= 0.8 and prediction['class'] == "Pothole":
-                            # Save with AI confidence score
-                            report = form.save(commit=False)
-                            report.ai_confidence_score = prediction['confidence']
-                            report.save()
-                            logger.info(f"Pothole report saved successfully with ID: {report.id}")
-                            return redirect('thank_you')
-                        else:
-                            logger.warning(f"AI rejected image: confidence={prediction.get('confidence')}, class={prediction.get('class')}")
-                            form.add_error(None, "The submitted image does not appear to contain a pothole. Please try to take a clearer picture.")
+                    if accepted:
+                        # Save with AI confidence score, verified like after deferred validation
+                        report = form.save(commit=False)
+                        report.ai_confidence_score = confidence
+                        report.status = 'verified'
+                        pothole, merged = PotholeReport.submit(report, **choice)
+                        logger.info(f"Pothole report {'merged into' if merged else 'saved successfully with'} ID: {pothole.id}")
+                        return redirect_to_thank_you(pothole, merged)
                     else:
-                        # If AI detection fails or no API key, still allow manual submission
-                        if not AI_AVAILABLE:
-                            logger.info("Saving report without AI validation")
-                            saved_report = form.save()
-                            logger.info(f"Pothole report saved successfully with ID: {saved_report.id}")
-                            return redirect('thank_you')
-                        else:
-                            logger.warning("AI detection returned no predictions")
-                            form.add_error(None, "The submitted image does not appear to contain a pothole. Please try to take a clearer picture.")
-                        
-                finally:
-                    if os.path.exists(temp_file_path):
-                        os.remove(temp_file_path)
-                        logger.info("Temporary file cleaned up")
+                        logger.warning(f"AI rejected image: confidence={confidence}")
+                        form.add_error(None, "The submitted image does not appear to contain a pothole. Please try to take a clearer picture.")
+                else:
+                    # If no API key, still allow manual submission
+                    logger.info("AI detection not available, saving report without AI validation")
+                    pothole, merged = PotholeReport.submit(form.save(commit=False), **choice)
+                    logger.info(f"Pothole report {'merged into' if merged else 'saved successfully with'} ID: {pothole.id}")
+                    return redirect_to_thank_you(pothole, merged)
 
             except Exception as e:
                 logger.error(f"Error processing pothole report: {str(e)}", exc_info=True)
@@ -168,6 +147,7 @@ def report_detail(request, report_id):
     })
 
 #SECTION FOR AUDITING REPORT
+@image_uploads
 def audit_report(request, report_id):
     report = get_object_or_404(PotholeReport, pk=report_id)
 
@@ -185,135 +165,54 @@ def audit_report(request, report_id):
 
     return render(request, 'audit_report.html', {'form': form, 'report': report})
 
+def redirect_to_thank_you(pothole, merged, validating=False):
+    query = {'report': pothole.id, 'merged': int(merged)}
+    if validating:
+        query['validating'] = 1
+    return redirect(f"{reverse('thank_you')}?{urlencode(query)}")
+
 def thank_you(request):
-    return render(request, 'thank_you.html')
+    pothole = None
+    report_id = request.GET.get('report', '')
+    if report_id.isdigit():
+        pothole = PotholeReport.objects.filter(pk=report_id).first()
+    return render(request, 'thank_you.html', {
+        'pothole': pothole,
+        'merged': request.GET.get('merged') == '1',
+        'validating': request.GET.get('validating') == '1' and pothole is not None and pothole.status == 'validating',
+    })
 
 #WHATSAPP REPORT RECEPTION
 @csrf_exempt
-def whatsapp_webhook(request):
-    if not TWILIO_AVAILABLE:
-        return HttpResponse("Twilio not available", status=503)
-    
-    if request.method == 'POST':
-        incoming_msg = request.POST.get('Body', '').lower()
-        from_number = request.POST.get('From').replace('whatsapp:', '')  
-        media_url = request.POST.get('MediaUrl0', None)
-        lat = request.POST.get('Latitude', None)
-        lon = request.POST.get('Longitude', None)
-
-        twilio_sid = settings.TWILIO_ACCOUNT_SID
-        twilio_auth_token = settings.TWILIO_AUTH_TOKEN
-
-        session = request.session
-        if 'submission' not in session:
-            session['submission'] = {}
-
-        resp = MessagingResponse()
-        msg = resp.message()
-
-        #CHECK SESSION DATA TO ENSURE DEPLOYMENT OF WELCOME MESSAGE IF FIRST MESSAGE IN SESSION
-        if 'first_message_sent' not in session:
-            # Send the initial welcome message automatically
-            msg.body("Welcome to Road Safety Tijuana! Please send 'new report' if you would like to make a report.")
-            session['first_message_sent'] = True  #AVOID RESENDING WELCOME MESSAGE
-            session.modified = True  
-            return HttpResponse(str(resp))  
-
-        # If user types "new report", reset the flow and ask for inputs
-        if 'new report' in incoming_msg:
-            msg.body("Please provide, in three separate messages, an image of the pothole, a pin with its location, and a rating from 1 through 5 on the severity of the pothole.")
-            session['submission'] = {}  # Reset submission data
-            session.modified = True
-            return HttpResponse(str(resp))
-
-        # Handle image submission
-        elif media_url:
-            try:
-                response = requests.get(media_url, auth=(twilio_sid, twilio_auth_token))
-                response.raise_for_status()
-
-                # Use Roboflow to check if the image contains a pothole
-                with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                    temp_file.write(response.content)
-                    temp_file_path = temp_file.name
-
-                if AI_AVAILABLE:
-                    result = detect_pothole_via_api(temp_file_path, settings.ROBOFLOW_API_KEY)
-                else:
-                    result = {'predictions': []}
-
-                if result['predictions']:
-                    prediction = result['predictions'][0]
-                    if prediction['confidence'] >= 0.8 and prediction['class'] == "Pothole":
-                        # Store the image URL and AI confidence in the session
-                        session['submission']['image_url'] = media_url
-                        session['submission']['ai_confidence'] = prediction['confidence']
-                        session.modified = True
-                        msg.body("Image received! Now, please send the location of the pothole as a pin.")
-                    else:
-                        msg.body("The image does not appear to be a pothole. Please send a clearer image.")
-                else:
-                    msg.body("The image does not appear to be a pothole. Please send a clearer image.")
-
-                os.remove(temp_file_path)  # Clean up temp file
-
-            except requests.RequestException as e:
-                msg.body(f"Failed to download the image. Error: {str(e)}")
-
-        # Handle location submission (pin)
-        elif lat and lon:
-            session['submission']['latitude'] = lat
-            session['submission']['longitude'] = lon
-            session.modified = True
-            msg.body("Location received! Now, please send a rating from 1 to 5 on the severity of the pothole.")
-
-        # Handle severity rating
-        elif incoming_msg.isdigit() and 1 <= int(incoming_msg) <= 5:
-            session['submission']['severity'] = incoming_msg
-            session.modified = True
-
-            # Now, check if we have all the required data (image, location, severity)
-            if 'image_url' in session['submission'] and 'latitude' in session['submission'] and 'longitude' in session['submission']:
-                media_url = session['submission'].pop('image_url')
-
-                try:
-                    response = requests.get(media_url, auth=(twilio_sid, twilio_auth_token))
-                    response.raise_for_status()
-
-                    form_data = {
-                        'phone_number': from_number,
-                        'severity': session['submission']['severity'],
-                        'latitude': session['submission']['latitude'],
-                        'longitude': session['submission']['longitude'],
-                        'submission_source': 'whatsapp',
-                        'whatsapp_message_id': request.POST.get('MessageSid', ''),
-                        'ai_confidence_score': session['submission'].get('ai_confidence', None),
-                        'status': 'verified',  # WhatsApp submissions are pre-verified by AI
-                    }
-                    form = PotholeReportForm(form_data, {'image': ContentFile(response.content, name="pothole_image.jpg")})
-                    if form.is_valid():
-                        form.save()
-                        msg.body("Thank you for your submission! The map has been updated. If you'd like to make another report, type 'new report'.")
-                        session['submission'] = {}  # Clear session after successful submission
-                    else:
-                        print("Form errors:", form.errors)
-                        msg.body("There was an error with your submission. Please try again.")
-                except requests.RequestException as e:
-                    msg.body(f"Failed to download the image. Error: {str(e)}")
-            else:
-                msg.body("Submission incomplete. Please provide all the required information.")
-
-        else:
-            # Catch-all for incomplete information or invalid inputs
-            if 'image_url' not in session['submission']:
-                msg.body("Please share an image of the pothole.")
-            elif 'latitude' not in session['submission'] or 'longitude' not in session['submission']:
-                msg.body("Please share the location (pin) of the pothole.")
-            elif 'severity' not in session['submission']:
-                msg.body("Please provide a severity rating from 1 to 5 for the pothole.")
-
-        return HttpResponse(str(resp))
-    return HttpResponse('OK', status=200)
+async def whatsapp_webhook(request):
+    """Accept an inbound WhatsApp message and queue it; the reply is sent through the Twilio API (see whatsapp.py)"""
+    if not (settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN):
+        return HttpResponse("Twilio not configured", status=503)
+    if request.method != 'POST':
+        return HttpResponse('OK', status=200)
+
+    message = request.POST.dict()
+    url = settings.TWILIO_WEBHOOK_URL or request.build_absolute_uri()
+    if not whatsapp.valid_signature(url, message, request.headers.get('X-Twilio-Signature')):
+        logger.warning("Rejected WhatsApp webhook call with an invalid signature")
+        return HttpResponse("Invalid signature", status=403)
+    if not normalize_number(message.get('From', '')) or not message.get('To'):
+        return HttpResponse("Missing sender", status=400)
+
+    if not await whatsapp.first_delivery(message.get('MessageSid')):
+        logger.info(f"Ignoring redelivered WhatsApp message {message['MessageSid']}")
+        return HttpResponse(whatsapp.twiml(), content_type='text/xml')
+    try:
+        queued = await sync_to_async(whatsapp.enqueue_message)(message)
+    except Exception:
+        # Processed within the request and failed: let Twilio's retry through
+        await whatsapp.forget_delivery(message.get('MessageSid'))
+        raise
+    if not queued:
+        await whatsapp.forget_delivery(message.get('MessageSid'))
+        logger.error("WhatsApp queue is full, asking Twilio to retry")
+        return HttpResponse("Busy", status=503)
+    return HttpResponse(whatsapp.twiml(), content_type='text/xml')
 
 @csrf_exempt
 def submit_pothole_report(session, from_number, msg):
@@ -332,7 +231,7 @@ def submit_pothole_report(session, from_number, msg):
         twilio_sid = settings.TWILIO_ACCOUNT_SID
         twilio_auth_token = settings.TWILIO_AUTH_TOKEN
 
-        response = requests.get(image_url, auth=(twilio_sid, twilio_auth_token))
+        response = requests.get(image_url, auth=(twilio_sid, twilio_auth_token), timeout=whatsapp_media.media_timeout())
         response.raise_for_status()  # Check for request errors
 
         # Create a file-like object from the downloaded image
@@ -343,7 +242,7 @@ def submit_pothole_report(session, from_number, msg):
         form = PotholeReportForm(form_data, {'image': image_content})
 
         if form.is_valid():
-            form.save()
+            PotholeReport.submit(form.save(commit=False))
             msg.body("Thank you for your submission! The map has been updated.")
             session['submission'] = {}  # Clear session data after submission
         else:
@@ -353,6 +252,119 @@ def submit_pothole_report(session, from_number, msg):
     except requests.RequestException as e:
         msg.body(f"Failed to download the image. Please try again later. Error: {str(e)}")
 
+def parse_map_query(request):
+    """
+    Read the bbox, zoom and status filters shared by the map data endpoints.
+    Raises ValueError on malformed input.
+    """
+    west, south, east, north = (float(part) for part in request.GET['bbox'].split(','))
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise ValueError('Invalid bounding box')
+    
+    zoom = int(request.GET.get('zoom', 12))
+    if not 0 <= zoom <= 22:
+        raise ValueError('Invalid zoom')
+    
+    statuses = None
+    if request.GET.get('status'):
+        statuses = request.GET['status'].split(',')
+        if any(status not in PotholeReport.PUBLIC_STATUSES for status in statuses):
+            raise ValueError('Invalid status')
+    
+    return (south, west, north, east), zoom, statuses
+
+def snapshot_features(bbox, statuses):
+    """GeoJSON point features for every report in bbox with one of the given statuses"""
+    snapshot = get_snapshot()
+    return snapshot.features(snapshot.rows(snapshot.mask(statuses=statuses, bbox=bbox)))
+
+def render_map_data(bbox, zoom, statuses, packed):
+    """Content type and body of a map_data response"""
+    if statuses is None and zoom <= settings.MAP_CLUSTER_MAX_ZOOM:
+        # Default view of open potholes: precomputed clusters for this zoom level
+        features = get_pyramid().features(zoom, bbox)
+        if packed:
+            return packing.CONTENT_TYPE, packing.encode_features(features)
+    elif packed:
+        snapshot = get_snapshot()
+        columns = snapshot.rows(snapshot.mask(statuses=statuses or PotholeReport.OPEN_STATUSES, bbox=bbox))
+        return packing.CONTENT_TYPE, packing.encode(
+            columns['id'], columns['latitude'], columns['longitude'],
+            columns['submission_count'], columns['severity'], columns['status'],
+        )
+    else:
+        features = snapshot_features(bbox, statuses or PotholeReport.OPEN_STATUSES)
+    
+    body = json.dumps({'type': 'FeatureCollection', 'zoom': zoom, 'features': features})
+    return 'application/json', body.encode()
+
+# API endpoint returning the reports inside the map viewport as GeoJSON,
+# or in the packed binary point format with ?format=packed
+def map_data(request):
+    try:
+        bbox, zoom, statuses = parse_map_query(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid map query'}, status=400)
+    packed = request.GET.get('format') == 'packed'
+    
+    # The viewport is widened to whole tiles of its zoom level, so panning
+    # within them hits the same cache entry instead of a new one per bbox
+    tiles = geo.tile_range(zoom, bbox)
+    content_type, body = cached(
+        'map-data',
+        lambda: render_map_data(geo.tile_range_bounds(zoom, *tiles), zoom, statuses, packed),
+        zoom, ','.join(map(str, tiles)), ','.join(statuses or []), packed,
+    )
+    return HttpResponse(body, content_type=content_type)
+
+def render_density(resolution):
+    """Body of a density response"""
+    density = get_density_grid()
+    cells, weights, max_weight = density.sparse(resolution)
+    return json.dumps({
+        'bounds': list(density.bounds),
+        'rows': resolution,
+        'cols': resolution,
+        'max': max_weight,
+        'cells': cells.tolist(),
+        'weights': weights.tolist(),
+    }).encode()
+
+# API endpoint returning the pothole density grid for the heat layer: the
+# non-empty cells as row-major indices (row 0 is the south edge) and weights
+def density_data(request):
+    density = get_density_grid()
+    try:
+        resolution = int(request.GET.get('resolution', density.resolutions[-1]))
+    except ValueError:
+        resolution = None
+    if resolution not in density.resolutions:
+        return JsonResponse({'error': 'Resolution must be one of %s' % density.resolutions}, status=400)
+    
+    body = cached('density', lambda: render_density(resolution), resolution)
+    return HttpResponse(body, content_type='application/json')
+
+# Slippy-map tile of pothole markers, revalidated by ETag
+def map_tile(request, z, x, y, packed=False):
+    if z > MAX_TILE_ZOOM or x >= 1 << z or y >= 1 << z:
+        return JsonResponse({'error': 'Tile out of range'}, status=404)
+    
+    body, etag = get_tile_index().render(z, x, y, packed=packed)
+    response = HttpResponse(body, content_type=packing.CONTENT_TYPE if packed else 'application/json')
+    response.headers['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.MAP_TILE_MAX_AGE_SECONDS)
+    return get_conditional_response(request, etag=etag, response=response)
+
+# API endpoint polled while a submission is validated out of band
+def report_status(request, report_id):
+    report = get_object_or_404(PotholeReport.objects.only('id', 'status', 'duplicate_of'), pk=report_id)
+    return JsonResponse({
+        'id': report.id,
+        'status': report.status,
+        'status_display': report.get_status_display(),
+        'duplicate_of': report.duplicate_of_id,
+    })
+
 # API endpoint for checking nearby potholes
 @csrf_exempt
 def check_nearby_potholes(request):
@@ -361,11 +373,18 @@ def check_nearby_potholes(request):
             latitude = float(request.POST.get('latitude'))
             longitude = float(request.POST.get('longitude'))
             
-            nearby_potholes = PotholeReport.find_nearby_potholes(latitude, longitude, radius_meters=50)
+            nearby_potholes = PotholeReport.find_nearby_potholes(
+                latitude, longitude, radius_meters=settings.POTHOLE_MERGE_RADIUS_METERS
+            )
             
             pothole_data = []
             for item in nearby_potholes:
                 pothole = item['pothole']
+                # Only potholes the public map shows
+                if pothole.status not in PotholeReport.OPEN_STATUSES:
+                    continue
+                if len(pothole_data) == 10:
+                    break
                 pothole_data.append({
                     'id': pothole.id,
                     'latitude': pothole.latitude,
@@ -373,7 +392,7 @@ def check_nearby_potholes(request):
                     'severity': pothole.severity,
                     'submission_count': pothole.submission_count,
                     'distance': round(item['distance'], 2),
-                    'image_url': pothole.image.url if pothole.image else None,
+                    'image_url': pothole.small_image_url,
                     'approximate_address': pothole.approximate_address or 'Address not available'
                 })
             
@@ -0,0 +1,360 @@
+"""
+WhatsApp reports, processed off the request.
+
+Twilio posts every inbound WhatsApp message to whatsapp_webhook, waits at
+most 15 seconds for the answer, and the photo step alone can take that long
+(media download plus detection). The webhook therefore only checks the
+request's Twilio signature, drops retried deliveries of a message it already
+accepted (by MessageSid), queues the message and answers at once with an
+empty TwiML response. A thread pool then runs process_message and sends its
+reply through Twilio's Messages API (send_reply). The state of each
+conversation is kept by sender in a conversation store (conversations.py);
+handle_message only moves that state, and the work it asks for (saving the
+report, dropping photos) runs once the new state is stored.
+
+Messages of one sender are processed one at a time and in order, so a photo
+is checked before the location and severity that follow it are applied.
+Queued messages only live in the worker process, like deferred validation
+jobs: a restart loses them and the sender is asked again by the next
+message. With WHATSAPP_WORKERS set to 0 messages are processed within the
+request instead, still answered through the API.
+
+The webhook is an async view: served through asgi.py it waits on the cache
+without holding a worker thread, and under WSGI it still answers without
+waiting for the processing.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from xml.sax.saxutils import escape
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image
+
+from .conversations import get_conversation_store, normalize_number
+from .detection import AI_AVAILABLE, evaluate_detection
+from .forms import PotholeReportForm
+from .images import DecodedImage
+from .inference_cache import detect_pothole
+from .models import PotholeReport
+from .photo_index import known_verdict
+from .uploads import check_image_bytes
+from .whatsapp_media import discard_media, fetch_media
+
+logger = logging.getLogger(__name__)
+
+# Twilio redelivers a message whose webhook call failed or timed out
+DELIVERED_PREFIX = 'mapapp:whatsapp-delivered:'
+DELIVERED_TIMEOUT_SECONDS = 24 * 3600
+
+
+def twilio_signature(url, params, auth_token):
+    """Twilio's X-Twilio-Signature for a POST to url with the given form parameters"""
+    payload = url + ''.join(f'{key}{params[key]}' for key in sorted(params))
+    digest = hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def valid_signature(url, params, signature):
+    if not settings.TWILIO_AUTH_TOKEN:
+        return False
+    return hmac.compare_digest(twilio_signature(url, params, settings.TWILIO_AUTH_TOKEN), signature or '')
+
+
+def twiml(reply=None):
+    """TwiML answering a webhook call with reply, or with nothing when the reply follows through the API"""
+    message = f'<Message>{escape(reply)}</Message>' if reply else ''
+    return f'<?xml version="1.0" encoding="UTF-8"?><Response>{message}</Response>'
+
+
+async def first_delivery(message_sid):
+    """Whether a MessageSid is seen for the first time (messages without one always are)"""
+    if not message_sid:
+        return True
+    return await cache.aadd(DELIVERED_PREFIX + message_sid, True, timeout=DELIVERED_TIMEOUT_SECONDS)
+
+
+async def forget_delivery(message_sid):
+    """Let a redelivery of a message that could not be queued or processed through"""
+    if message_sid:
+        await cache.adelete(DELIVERED_PREFIX + message_sid)
+
+
+class ConversationQueue:
+    """
+    Runs jobs on a thread pool, one at a time per key and in the order they
+    were submitted, so different senders proceed in parallel while each
+    sender's messages stay in order
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='whatsapp')
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.pending = 0
+
+    def submit(self, key, job):
+        """Queue a job; returns False without queueing it when max_pending jobs are waiting"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            if key in self.queues:
+                # A drain for this key is running and will pick the job up
+                self.queues[key].append(job)
+                return True
+            self.queues[key] = deque([job])
+        self.executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key):
+        while True:
+            with self.lock:
+                if not self.queues[key]:
+                    del self.queues[key]
+                    return
+                job = self.queues[key].popleft()
+            try:
+                job()
+            except Exception:
+                logger.exception(f"WhatsApp message from {key} failed")
+            finally:
+                with self.lock:
+                    self.pending -= 1
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ConversationQueue(settings.WHATSAPP_WORKERS, settings.WHATSAPP_MAX_PENDING)
+    return _queue
+
+
+def enqueue_message(message):
+    """Process an inbound message in the background; returns False if the queue is full"""
+    if settings.WHATSAPP_WORKERS <= 0:
+        process_message(message)
+        return True
+    return get_queue().submit(normalize_number(message['From']), lambda: _run_in_background(message))
+
+
+def _run_in_background(message):
+    close_old_connections()
+    try:
+        process_message(message)
+    finally:
+        close_old_connections()
+
+
+_api = requests.Session()
+
+
+def send_reply(message, body):
+    """Send body to the sender of an inbound message through Twilio's Messages API"""
+    url = f'{settings.TWILIO_API_URL}/2010-04-01/Accounts/{settings.TWILIO_ACCOUNT_SID}/Messages.json'
+    try:
+        response = _api.post(
+            url,
+            data={'From': message['To'], 'To': message['From'], 'Body': body},
+            auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+            timeout=settings.TWILIO_API_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        return True
+    except requests.RequestException as e:
+        logger.error(f"Could not send WhatsApp reply: {e}")
+        return False
+
+
+def process_message(message):
+    """Apply an inbound message to the sender's conversation and send the reply"""
+    number = normalize_number(message['From'])
+    media_url = message.get('MediaUrl0', None)
+    # Downloading and checking a photo does not depend on the conversation,
+    # so it happens once here rather than in a step that may run again
+    photo = check_photo(media_url) if media_url and 'new report' not in message.get('Body', '').lower() else None
+
+    reply, actions = get_conversation_store().transition(
+        number, lambda state: handle_message(state, message, photo)
+    )
+    # Side effects run once, after the new state was stored
+    for action in actions:
+        reply = action() or reply
+    if reply:
+        send_reply(message, reply)
+
+
+def check_photo(media_url):
+    """
+    Download and check a photo sent in a message. Returns ((accepted,
+    confidence), None), or (None, reply) when the photo could not be checked.
+    """
+    try:
+        # Kept until the report is saved, so the photo is downloaded only once
+        content = fetch_media(media_url)
+
+        # Use Roboflow to check if the image contains a pothole,
+        # unless the same photo was checked before
+        if not AI_AVAILABLE:
+            return (False, None), None
+        check_image_bytes(content)
+        image = DecodedImage(content)
+        verdict = known_verdict(image.image_hash())
+        if verdict is None:
+            result = detect_pothole(image.detection_jpeg())
+            # Degraded mode: take the photo and leave the report for manual review
+            verdict = (True, None) if 'error' in result else evaluate_detection(result)
+        return verdict, None
+
+    except requests.RequestException as e:
+        return None, f"Failed to download the image. Error: {str(e)}"
+    except (OSError, ValueError, Image.DecompressionBombError):
+        discard_media(media_url)
+        return None, "The image could not be read. Please send a .jpg or .png photo."
+
+
+def handle_message(state, message, photo=None):
+    """
+    Advance a conversation's state by one inbound message, given the outcome
+    of check_photo for a photo it carries. Changes nothing but state, as the
+    conversation store may run it again on a newer state; returns (reply,
+    actions), where actions are callables to run once the state is stored,
+    each returning a reply that replaces the previous one, or None.
+    """
+    incoming_msg = message.get('Body', '').lower()
+    media_url = message.get('MediaUrl0', None)
+    lat = message.get('Latitude', None)
+    lon = message.get('Longitude', None)
+
+    if 'submission' not in state:
+        state['submission'] = {}
+
+    #CHECK STATE TO ENSURE DEPLOYMENT OF WELCOME MESSAGE IF FIRST MESSAGE IN CONVERSATION
+    if 'first_message_sent' not in state:
+        # Send the initial welcome message automatically
+        state['first_message_sent'] = True  #AVOID RESENDING WELCOME MESSAGE
+        actions = [partial(discard_media, media_url)] if photo is not None else []
+        return "Welcome to Road Safety Tijuana! Please send 'new report' if you would like to make a report.", actions
+
+    # If user types "new report", reset the flow and ask for inputs
+    if 'new report' in incoming_msg:
+        previous_url = state['submission'].get('image_url')
+        state['submission'] = {}  # Reset submission data
+        state.pop('submitting', None)
+        return "Please provide, in three separate messages, an image of the pothole, a pin with its location, and a rating from 1 through 5 on the severity of the pothole.", [partial(discard_media, previous_url)]
+
+    # Handle image submission
+    elif media_url:
+        verdict, failure = photo
+        if failure:
+            return failure, []
+        accepted, confidence = verdict
+
+        if accepted:
+            # Store the image URL and AI confidence in the conversation;
+            # a photo sent earlier in the conversation is replaced
+            actions = []
+            if state['submission'].get('image_url') != media_url:
+                actions.append(partial(discard_media, state['submission'].get('image_url')))
+            state['submission']['image_url'] = media_url
+            state['submission']['ai_confidence'] = confidence
+            return "Image received! Now, please send the location of the pothole as a pin.", actions
+        return "The image does not appear to be a pothole. Please send a clearer image.", [partial(discard_media, media_url)]
+
+    # Handle location submission (pin)
+    elif lat and lon:
+        state['submission']['latitude'] = lat
+        state['submission']['longitude'] = lon
+        return "Location received! Now, please send a rating from 1 to 5 on the severity of the pothole.", []
+
+    # Handle severity rating
+    elif incoming_msg.isdigit() and 1 <= int(incoming_msg) <= 5:
+        state['submission']['severity'] = incoming_msg
+
+        # Now, check if we have all the required data (image, location, severity)
+        if not ('image_url' in state['submission'] and 'latitude' in state['submission'] and 'longitude' in state['submission']):
+            return "Submission incomplete. Please provide all the required information.", []
+
+        # The submission leaves the conversation, so a concurrent severity
+        # message cannot save it a second time; submit_report puts it back
+        # should the report not be saved
+        submission = state['submission']
+        state['submitting'] = submission
+        state['submission'] = {}
+        return None, [partial(submit_report, message, submission)]
+
+    # Catch-all for incomplete information or invalid inputs
+    if 'image_url' not in state['submission']:
+        return "Please share an image of the pothole.", []
+    elif 'latitude' not in state['submission'] or 'longitude' not in state['submission']:
+        return "Please share the location (pin) of the pothole.", []
+    elif 'severity' not in state['submission']:
+        return "Please provide a severity rating from 1 to 5 for the pothole.", []
+    return None, []
+
+
+def submit_report(message, submission):
+    """Save the report of a completed submission; returns the reply"""
+    number = normalize_number(message['From'])
+    media_url = submission['image_url']
+    try:
+        content = fetch_media(media_url)
+    except requests.RequestException as e:
+        # The photo stays in the conversation, so sending the severity again retries
+        settle_submission(number, submission, keep=True)
+        return f"Failed to download the image. Error: {str(e)}"
+
+    form_data = {
+        'phone_number': message['From'].replace('whatsapp:', ''),
+        'severity': submission['severity'],
+        'latitude': submission['latitude'],
+        'longitude': submission['longitude'],
+    }
+    form = PotholeReportForm(form_data, {'image': ContentFile(content, name="pothole_image.jpg")})
+    if not form.is_valid():
+        logger.warning(f"WhatsApp submission rejected: {form.errors.as_json()}")
+        settle_submission(number, submission, keep=True)
+        return "There was an error with your submission. Please try again."
+
+    report = form.save(commit=False)
+    # Fields that are not part of the web form
+    report.submission_source = 'whatsapp'
+    report.whatsapp_message_id = message.get('MessageSid', '')
+    report.ai_confidence_score = submission.get('ai_confidence', None)
+    # WhatsApp submissions are pre-verified by AI, unless the detector was unavailable
+    report.status = 'verified' if report.ai_confidence_score is not None else 'pending'
+    pothole, merged = PotholeReport.submit(report)
+    discard_media(media_url)
+    settle_submission(number, submission, keep=False)
+    if merged:
+        return f"Thank you! This pothole was already reported, so we added your report to it ({pothole.submission_count} reports so far). If you'd like to make another report, type 'new report'."
+    return "Thank you for your submission! The map has been updated. If you'd like to make another report, type 'new report'."
+
+
+def settle_submission(number, submission, keep):
+    """
+    Finish a submission handed to submit_report: forget it, or with keep put
+    it back into the conversation unless the sender has started another one
+    """
+    def step(state):
+        if state.get('submitting') == submission:
+            del state['submitting']
+            if keep and not state.get('submission'):
+                state['submission'] = submission
+
+    get_conversation_store().transition(number, step)
@@ -0,0 +1,63 @@
+"""
+Photos sent over WhatsApp, kept between the messages of a conversation.
+
+A WhatsApp report arrives as several webhook calls: the photo, which is
+checked by the detector, then the location and the severity, after which the
+report is saved with the photo. fetch_media downloads a Twilio media URL once
+and keeps the bytes in the shared cache, keyed by the URL, so the final
+message finds them there instead of downloading the photo again, whichever
+worker handles it. Entries expire after WHATSAPP_MEDIA_TTL_SECONDS, so photos
+of conversations that are never finished clean themselves up; the webhook
+discards them as soon as the report is saved, the photo is rejected or the
+user starts over. An expired entry is simply downloaded again.
+"""
+import hashlib
+import logging
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+MEDIA_PREFIX = 'mapapp:whatsapp-media:'
+
+
+def media_key(media_url):
+    return MEDIA_PREFIX + hashlib.sha256(media_url.encode()).hexdigest()
+
+
+def media_timeout():
+    """(connect, read) timeouts of a media download"""
+    return (settings.WHATSAPP_MEDIA_CONNECT_TIMEOUT_SECONDS, settings.WHATSAPP_MEDIA_TIMEOUT_SECONDS)
+
+
+def fetch_media(media_url):
+    """
+    The bytes of a Twilio media URL, downloaded unless an earlier message of
+    the conversation already did. Raises requests.RequestException when the
+    download fails or times out.
+    """
+    key = media_key(media_url)
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    response = requests.get(
+        media_url,
+        auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+        timeout=media_timeout(),
+    )
+    response.raise_for_status()
+    data = response.content
+    # Larger files are refused anyway (see uploads.check_image_bytes)
+    if len(data) <= settings.MAX_UPLOAD_BYTES:
+        cache.set(key, data, timeout=settings.WHATSAPP_MEDIA_TTL_SECONDS)
+    logger.info(f"Downloaded WhatsApp media: {len(data)} bytes")
+    return data
+
+
+def discard_media(media_url):
+    """Drop the stored bytes of a media URL once the conversation no longer needs them"""
+    if media_url:
+        cache.delete(media_key(media_url))